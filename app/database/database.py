@@ -1,12 +1,101 @@
+from sqlalchemy import event, update
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from decouple import config
 
-DATABASE_URL = "sqlite+aiosqlite:///./data/prediction.db"
+from app.models.models import WriteCounter
+
+DATABASE_URL = config("DATABASE_URL", default="sqlite+aiosqlite:///./data/prediction.db")
+# For the few places that open the file with the sqlite3 module directly
+DATABASE_PATH = make_url(DATABASE_URL).database
+
+# Logging every statement is expensive on the Pi, so it is opt-in for debugging
+DB_ECHO = config("DB_ECHO", default=False, cast=bool)
+DB_READ_POOL_SIZE = config("DB_READ_POOL_SIZE", default=4, cast=int)
+DB_BUSY_TIMEOUT_MS = config("DB_BUSY_TIMEOUT_MS", default=5000, cast=int)
+DB_SYNCHRONOUS = config("DB_SYNCHRONOUS", default="NORMAL")
+DB_CACHE_SIZE_KB = config("DB_CACHE_SIZE_KB", default=16384, cast=int)
+DB_MMAP_SIZE = config("DB_MMAP_SIZE", default=64 * 1024 * 1024, cast=int)
+DB_TEMP_STORE = config("DB_TEMP_STORE", default="MEMORY")
+
+
+def _apply_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    for pragma in pragmas:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+def _connection_pragmas():
+    return [
+        f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}",
+        f"PRAGMA synchronous = {DB_SYNCHRONOUS}",
+        # Negative cache_size is in KiB rather than pages
+        f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}",
+        f"PRAGMA mmap_size = {DB_MMAP_SIZE}",
+        f"PRAGMA temp_store = {DB_TEMP_STORE}",
+    ]
+
+
+def _on_write_connect(dbapi_connection, connection_record):
+    # The driver's implicit transactions are turned off so _begin_immediate
+    # decides how each one starts
+    dbapi_connection.isolation_level = None
+    # WAL lets readers keep going while the writer commits; the setting is
+    # persistent, so only the writer needs to issue it
+    # auto_vacuum only takes effect on a new database or after a VACUUM; the
+    # maintenance scheduler takes care of existing ones
+    _apply_pragmas(
+        dbapi_connection,
+        ["PRAGMA auto_vacuum = INCREMENTAL", "PRAGMA journal_mode = WAL"] + _connection_pragmas(),
+    )
+
+
+def _begin_immediate(conn):
+    # Several server processes may write at once. Taking the write lock up
+    # front makes them wait on busy_timeout; a transaction that read first
+    # would fail with "database is locked" once another process committed
+    conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def _count_write(session):
+    if session.bind is not write_engine.sync_engine:
+        return
+    # Other processes poll this row to learn that their caches are stale;
+    # the new value is kept for app.services.cache to tell our own writes apart
+    session.info["writes"] = session.execute(
+        update(WriteCounter)
+        .values(writes=WriteCounter.writes + 1)
+        .returning(WriteCounter.writes)
+    ).scalar()
+
+
+def _on_read_connect(dbapi_connection, connection_record):
+    _apply_pragmas(dbapi_connection, _connection_pragmas() + ["PRAGMA query_only = ON"])
+
+
+# SQLite allows one writer at a time, so writes share a single connection
+# and queue in the pool instead of failing with "database is locked"
+write_engine = create_async_engine(
+    DATABASE_URL, echo=DB_ECHO, pool_size=1, max_overflow=0
+)
+event.listen(write_engine.sync_engine, "connect", _on_write_connect)
+event.listen(write_engine.sync_engine, "begin", _begin_immediate)
+event.listen(Session, "before_commit", _count_write)
+
+engine = create_async_engine(
+    DATABASE_URL, echo=DB_ECHO, pool_size=DB_READ_POOL_SIZE, max_overflow=0
+)
+event.listen(engine.sync_engine, "connect", _on_read_connect)
 
-engine = create_async_engine(DATABASE_URL, echo=True)
 SessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+WriteSessionLocal = sessionmaker(write_engine, class_=AsyncSession, expire_on_commit=False)
 
 async def get_db():
     async with SessionLocal() as session:
         yield session
+
+async def get_write_db():
+    async with WriteSessionLocal() as session:
+        yield session
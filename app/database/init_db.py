@@ -1,38 +1,54 @@
-from sqlalchemy import inspect
-from sqlalchemy.engine import reflection
-from app.database.database import engine, SessionLocal
-from app.models.models import Base, User, Category
+import logging
+import os
+import time
+
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+
+from app.database.database import write_engine
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "migrations")
+
+# Seconds the last init_db() call took, for startup diagnostics
+startup_seconds = None
+
+
+def alembic_config(connection=None):
+    # Built in code rather than read from alembic.ini so the container
+    # does not need the ini file next to the package
+    config = Config()
+    config.set_main_option("script_location", MIGRATIONS_DIR)
+    config.attributes["connection"] = connection
+    return config
+
+
+def head_revision():
+    return ScriptDirectory.from_config(alembic_config()).get_current_head()
+
+
+def upgrade_if_needed(connection):
+    # An up-to-date database costs a single read of alembic_version
+    current = MigrationContext.configure(connection).get_current_revision()
+    head = head_revision()
+    if current == head:
+        return current, False
+    command.upgrade(alembic_config(connection), "head")
+    return head, True
+
 
 async def init_db():
-    async with engine.begin() as conn:
-        
-        # Run synchronous inspection and potential ALTER
-        def run_migration_if_needed(conn):
-            inspector = inspect(conn)
-            if "predictions" in inspector.get_table_names():
-                columns = [c["name"] for c in inspector.get_columns("predictions")]
-                if "opponent_id" not in columns:
-                    conn.exec_driver_sql(
-                        "ALTER TABLE predictions ADD COLUMN opponent_id INTEGER REFERENCES users(id)"
-                    )
-
-        await conn.run_sync(run_migration_if_needed)
-        await conn.run_sync(Base.metadata.create_all)
-    async with SessionLocal() as session:
-        if (await session.execute(User.__table__.select())).first() is None:
-            session.add_all(
-                [
-                    User(name="Husband"),
-                    User(name="Wife"),
-                ]
-            )
-            await session.commit()
-        if (await session.execute(Category.__table__.select())).first() is None:
-            session.add_all(
-                [
-                    Category(name="Love is Blind"),
-                    Category(name="General"),
-                    Category(name="Politics"),
-                ]
-            )
-            await session.commit()
+    global startup_seconds
+    started = time.perf_counter()
+    async with write_engine.begin() as conn:
+        revision, migrated = await conn.run_sync(upgrade_if_needed)
+    startup_seconds = time.perf_counter() - started
+    logger.info(
+        "Database schema %s revision %s in %.1f ms",
+        "migrated to" if migrated else "already at",
+        revision,
+        startup_seconds * 1000,
+    )
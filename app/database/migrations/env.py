@@ -0,0 +1,67 @@
+import asyncio
+from logging.config import fileConfig
+
+from alembic import context
+
+from app.database.database import DATABASE_URL, write_engine
+from app.models.models import Base
+
+config = context.config
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def include_name(name, type_, parent_names):
+    # The full-text index and its shadow tables are managed by hand in 0005
+    if type_ == "table":
+        return not name.startswith("predictions_fts")
+    return True
+
+
+def run_migrations(connection):
+    # Batch mode lets autogenerated ALTERs work on SQLite
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        include_name=include_name,
+        render_as_batch=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_offline():
+    context.configure(
+        url=DATABASE_URL,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+        include_name=include_name,
+        render_as_batch=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def run_async_migrations():
+    async with write_engine.begin() as connection:
+        await connection.run_sync(run_migrations)
+    await write_engine.dispose()
+
+
+def run_migrations_online():
+    # init_db() hands us its already-open connection; the CLI does not
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        run_migrations(connection)
+    else:
+        asyncio.run(run_async_migrations())
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,170 @@
+"""Initial schema
+
+Creates users, categories, predictions and the balances ledger together with
+the indexes the prediction listings rely on. Databases created before
+migrations were introduced already have some of these objects, so every step
+checks what exists first; this replaces the inspector checks init_db used to
+run on every startup.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from collections import defaultdict
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PREDICTION_INDEXES = {
+    "ix_predictions_id": ["id"],
+    "ix_predictions_description": ["description"],
+    "ix_predictions_created_at_id": ["created_at", "id"],
+    "ix_predictions_status_created_at": ["status", "created_at", "id"],
+    "ix_predictions_creator_created_at": ["creator_id", "created_at", "id"],
+    "ix_predictions_opponent_created_at": ["opponent_id", "created_at", "id"],
+    "ix_predictions_category_created_at": ["category_id", "created_at", "id"],
+}
+
+
+def _create_named_table(name):
+    op.create_table(
+        name,
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(f"ix_{name}_id", name, ["id"], unique=False)
+    op.create_index(f"ix_{name}_name", name, ["name"], unique=True)
+
+
+def _ledger_entry(row):
+    # The odds as they stood when this revision was written; migrations keep
+    # their own copy so later changes to app.services.ledger cannot alter them
+    if row.status != "RESOLVED" or row.opponent_id is None:
+        return None
+    # Rows stored at 0% or 100% have no odds; 0002 clamps them the same way
+    confidence = min(max(row.confidence, 0.01), 0.99)
+    if confidence >= 0.5:
+        if row.outcome:
+            return (row.opponent_id, row.creator_id, 1.0)
+        return (row.creator_id, row.opponent_id, confidence / (1 - confidence))
+    if row.outcome:
+        return (row.opponent_id, row.creator_id, (1 - confidence) / confidence)
+    return (row.creator_id, row.opponent_id, 1.0)
+
+
+def _backfill_balances(bind):
+    rows = bind.execute(
+        sa.text(
+            "SELECT status, creator_id, opponent_id, confidence, outcome "
+            "FROM predictions WHERE status = 'RESOLVED'"
+        )
+    )
+    totals = defaultdict(float)
+    for row in rows:
+        entry = _ledger_entry(row)
+        if entry is not None:
+            totals[(entry[0], entry[1])] += entry[2]
+    if totals:
+        balances = sa.table(
+            "balances",
+            sa.column("debtor_id", sa.Integer),
+            sa.column("creditor_id", sa.Integer),
+            sa.column("amount", sa.Float),
+        )
+        op.bulk_insert(
+            balances,
+            [
+                {"debtor_id": debtor_id, "creditor_id": creditor_id, "amount": amount}
+                for (debtor_id, creditor_id), amount in totals.items()
+            ],
+        )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+
+    for name in ("users", "categories"):
+        if name not in existing_tables:
+            _create_named_table(name)
+
+    if "predictions" not in existing_tables:
+        op.create_table(
+            "predictions",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("description", sa.String(), nullable=True),
+            sa.Column("creator_id", sa.Integer(), nullable=True),
+            sa.Column("opponent_id", sa.Integer(), nullable=True),
+            sa.Column("category_id", sa.Integer(), nullable=True),
+            sa.Column("confidence", sa.Float(), nullable=True),
+            sa.Column("status", sa.String(), nullable=True),
+            sa.Column("outcome", sa.Boolean(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(["category_id"], ["categories.id"]),
+            sa.ForeignKeyConstraint(["creator_id"], ["users.id"]),
+            sa.ForeignKeyConstraint(["opponent_id"], ["users.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        )
+    else:
+        columns = {c["name"] for c in inspector.get_columns("predictions")}
+        if "opponent_id" not in columns:
+            op.execute(
+                "ALTER TABLE predictions ADD COLUMN opponent_id INTEGER REFERENCES users(id)"
+            )
+
+    existing_indexes = (
+        {index["name"] for index in inspector.get_indexes("predictions")}
+        if "predictions" in existing_tables
+        else set()
+    )
+    for name, columns in PREDICTION_INDEXES.items():
+        if name not in existing_indexes:
+            op.create_index(name, "predictions", columns)
+
+    if "balances" not in existing_tables:
+        op.create_table(
+            "balances",
+            sa.Column("debtor_id", sa.Integer(), nullable=False),
+            sa.Column("creditor_id", sa.Integer(), nullable=False),
+            sa.Column("amount", sa.Float(), nullable=False),
+            sa.ForeignKeyConstraint(["creditor_id"], ["users.id"]),
+            sa.ForeignKeyConstraint(["debtor_id"], ["users.id"]),
+            sa.PrimaryKeyConstraint("debtor_id", "creditor_id"),
+        )
+        if "predictions" in existing_tables:
+            _backfill_balances(bind)
+
+    # Seed the default users and categories on a brand new database
+    if bind.execute(sa.text("SELECT 1 FROM users LIMIT 1")).first() is None:
+        op.bulk_insert(
+            sa.table("users", sa.column("name", sa.String)),
+            [{"name": "Husband"}, {"name": "Wife"}],
+        )
+    if bind.execute(sa.text("SELECT 1 FROM categories LIMIT 1")).first() is None:
+        op.bulk_insert(
+            sa.table("categories", sa.column("name", sa.String)),
+            [{"name": "Love is Blind"}, {"name": "General"}, {"name": "Politics"}],
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("balances")
+    for name in PREDICTION_INDEXES:
+        op.drop_index(name, table_name="predictions")
+    op.drop_table("predictions")
+    for name in ("categories", "users"):
+        op.drop_index(f"ix_{name}_name", table_name=name)
+        op.drop_index(f"ix_{name}_id", table_name=name)
+        op.drop_table(name)
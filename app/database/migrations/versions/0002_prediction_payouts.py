@@ -0,0 +1,58 @@
+"""Store payout units on predictions
+
+Adds win_units and loss_units, the creator's stake on either outcome, so the
+stats queries read them instead of re-deriving the odds for every row.
+Confidences of 0% or 100%, where the odds are undefined, are clamped to the
+new-prediction slider's range first.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MIN_CONFIDENCE = 0.01
+MAX_CONFIDENCE = 0.99
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("predictions", sa.Column("win_units", sa.Float(), nullable=True))
+    op.add_column("predictions", sa.Column("loss_units", sa.Float(), nullable=True))
+
+    # The odds are undefined at 0% and 100%, which the API now rejects. Older
+    # rows stored there are moved to the slider's end stops so they can be
+    # settled and shown like any other bet
+    op.execute(
+        f"UPDATE predictions SET confidence = {MIN_CONFIDENCE} WHERE confidence <= 0"
+    )
+    op.execute(
+        f"UPDATE predictions SET confidence = {MAX_CONFIDENCE} WHERE confidence >= 1"
+    )
+
+    # Spelled out here rather than taken from app.services.odds, which may
+    # change after this revision
+    op.execute(
+        "UPDATE predictions SET "
+        "win_units = CASE WHEN confidence >= 0.5 THEN 1.0 "
+        "ELSE (1 - confidence) / confidence END, "
+        "loss_units = CASE WHEN confidence >= 0.5 THEN confidence / (1 - confidence) "
+        "ELSE 1.0 END"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("predictions") as batch_op:
+        batch_op.drop_column("loss_units")
+        batch_op.drop_column("win_units")
@@ -0,0 +1,93 @@
+"""Calibration accumulators
+
+Adds calibration_buckets, running Brier score and log loss totals per creator,
+category and confidence bucket, and fills it from the decided predictions.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+import math
+from collections import defaultdict
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, Sequence[str], None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# A snapshot of the scoring in app.services.calibration at this revision, so
+# the backfill fills the same buckets whatever that module becomes
+BUCKETS = 10
+LOG_LOSS_CLIP = 1e-15
+FIELDS = ("count", "confidence_sum", "hits", "brier_sum", "log_loss_sum")
+
+
+def _accumulate(rows):
+    totals = defaultdict(lambda: [0, 0.0, 0, 0.0, 0.0])
+    for row in rows:
+        if row.outcome is None:
+            continue
+        confidence = row.confidence
+        happened = 1 if row.outcome else 0
+        clipped = min(max(confidence, LOG_LOSS_CLIP), 1 - LOG_LOSS_CLIP)
+        bucket = min(int(confidence * BUCKETS), BUCKETS - 1)
+        deltas = (
+            1,
+            confidence,
+            happened,
+            (confidence - happened) ** 2,
+            -math.log(clipped if happened else 1 - clipped),
+        )
+        sums = totals[(row.creator_id, row.category_id or 0, bucket)]
+        for i, delta in enumerate(deltas):
+            sums[i] += delta
+    return totals
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    calibration_buckets = op.create_table(
+        "calibration_buckets",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("category_id", sa.Integer(), nullable=False),
+        sa.Column("bucket", sa.Integer(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.Column("confidence_sum", sa.Float(), nullable=False),
+        sa.Column("hits", sa.Integer(), nullable=False),
+        sa.Column("brier_sum", sa.Float(), nullable=False),
+        sa.Column("log_loss_sum", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("user_id", "category_id", "bucket"),
+    )
+
+    rows = op.get_bind().execute(
+        sa.text(
+            "SELECT creator_id, category_id, confidence, outcome FROM predictions "
+            "WHERE status IN ('RESOLVED', 'REDEEMED')"
+        )
+    )
+    totals = _accumulate(rows)
+    if totals:
+        op.bulk_insert(
+            calibration_buckets,
+            [
+                {
+                    "user_id": user_id,
+                    "category_id": category_id,
+                    "bucket": bucket,
+                    **dict(zip(FIELDS, sums)),
+                }
+                for (user_id, category_id, bucket), sums in totals.items()
+            ],
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("calibration_buckets")
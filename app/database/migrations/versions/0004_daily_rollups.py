@@ -0,0 +1,109 @@
+"""Settlement timestamps and daily rollups
+
+Records when each prediction was resolved and redeemed, and adds
+daily_rollups, per-day totals for each pair of users and category that the
+balance history endpoint reads. Existing settled bets have no timestamps, so
+their rollups are dated by when they were created.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from collections import defaultdict
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, Sequence[str], None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+FIELDS = ("resolved_count", "won_units", "paid_units")
+
+
+def _accumulate(rows):
+    # The rollup rules of app.services.rollups as of this revision, kept here
+    # so the backfill does not follow later edits to that module
+    totals = defaultdict(lambda: [0, 0.0, 0.0])
+    for row in rows:
+        if row.opponent_id is None:
+            continue
+        # Units won by the lower user id of the pair
+        units = row.win_units if row.outcome else -row.loss_units
+        if row.creator_id < row.opponent_id:
+            user_a_id, user_b_id = row.creator_id, row.opponent_id
+        else:
+            user_a_id, user_b_id, units = row.opponent_id, row.creator_id, -units
+        category_id = row.category_id or 0
+        resolved_at = row.resolved_at or row.created_at
+        sums = totals[(resolved_at.date(), user_a_id, user_b_id, category_id)]
+        sums[0] += 1
+        sums[1] += units
+        if row.status == "REDEEMED":
+            redeemed_at = row.redeemed_at or resolved_at
+            totals[(redeemed_at.date(), user_a_id, user_b_id, category_id)][2] += units
+    return totals
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("predictions", sa.Column("resolved_at", sa.DateTime(), nullable=True))
+    op.add_column("predictions", sa.Column("redeemed_at", sa.DateTime(), nullable=True))
+    daily_rollups = op.create_table(
+        "daily_rollups",
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("user_a_id", sa.Integer(), nullable=False),
+        sa.Column("user_b_id", sa.Integer(), nullable=False),
+        sa.Column("category_id", sa.Integer(), nullable=False),
+        sa.Column("resolved_count", sa.Integer(), nullable=False),
+        sa.Column("won_units", sa.Float(), nullable=False),
+        sa.Column("paid_units", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(["user_a_id"], ["users.id"]),
+        sa.ForeignKeyConstraint(["user_b_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("day", "user_a_id", "user_b_id", "category_id"),
+    )
+
+    # Typed columns so created_at comes back as a datetime, not SQLite text
+    predictions = sa.table(
+        "predictions",
+        sa.column("status", sa.String),
+        sa.column("creator_id", sa.Integer),
+        sa.column("opponent_id", sa.Integer),
+        sa.column("category_id", sa.Integer),
+        sa.column("win_units", sa.Float),
+        sa.column("loss_units", sa.Float),
+        sa.column("outcome", sa.Boolean),
+        sa.column("created_at", sa.DateTime),
+        sa.column("resolved_at", sa.DateTime),
+        sa.column("redeemed_at", sa.DateTime),
+    )
+    rows = op.get_bind().execute(
+        sa.select(predictions).where(predictions.c.status.in_(["RESOLVED", "REDEEMED"]))
+    )
+    totals = _accumulate(rows)
+    if totals:
+        op.bulk_insert(
+            daily_rollups,
+            [
+                {
+                    "day": day,
+                    "user_a_id": user_a_id,
+                    "user_b_id": user_b_id,
+                    "category_id": category_id,
+                    **dict(zip(FIELDS, sums)),
+                }
+                for (day, user_a_id, user_b_id, category_id), sums in totals.items()
+            ],
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("daily_rollups")
+    with op.batch_alter_table("predictions") as batch_op:
+        batch_op.drop_column("redeemed_at")
+        batch_op.drop_column("resolved_at")
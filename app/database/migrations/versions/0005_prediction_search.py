@@ -0,0 +1,62 @@
+"""Full-text search over prediction descriptions
+
+Adds predictions_fts, an external-content FTS5 index of
+predictions.description, with triggers that keep it in sync, and indexes the
+existing rows. Batch migrations that recreate the predictions table drop
+these triggers, so such a migration has to create them again.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, Sequence[str], None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TRIGGERS = {
+    "predictions_fts_insert": """
+        CREATE TRIGGER predictions_fts_insert AFTER INSERT ON predictions BEGIN
+            INSERT INTO predictions_fts (rowid, description) VALUES (new.id, new.description);
+        END
+    """,
+    "predictions_fts_delete": """
+        CREATE TRIGGER predictions_fts_delete AFTER DELETE ON predictions BEGIN
+            INSERT INTO predictions_fts (predictions_fts, rowid, description)
+            VALUES ('delete', old.id, old.description);
+        END
+    """,
+    "predictions_fts_update": """
+        CREATE TRIGGER predictions_fts_update AFTER UPDATE OF description ON predictions BEGIN
+            INSERT INTO predictions_fts (predictions_fts, rowid, description)
+            VALUES ('delete', old.id, old.description);
+            INSERT INTO predictions_fts (rowid, description) VALUES (new.id, new.description);
+        END
+    """,
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Prefix indexes make the "word*" queries the search box sends cheap
+    op.execute(
+        "CREATE VIRTUAL TABLE predictions_fts USING fts5("
+        "description, content='predictions', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    for sql in TRIGGERS.values():
+        op.execute(sql)
+    op.execute("INSERT INTO predictions_fts (predictions_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    op.execute("DROP TABLE predictions_fts")
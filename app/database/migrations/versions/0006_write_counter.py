@@ -0,0 +1,36 @@
+"""Write counter
+
+Adds write_counter, a single row that every write transaction increments, so
+server processes can tell when another process has changed the database.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, Sequence[str], None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    write_counter = op.create_table(
+        "write_counter",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("writes", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.bulk_insert(write_counter, [{"id": 1, "writes": 0}])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("write_counter")
@@ -0,0 +1,169 @@
+"""Archive for old redeemed predictions
+
+Adds archived_predictions, where old redeemed predictions are moved with
+their ids, and archived_user_stats, what those predictions add to the user
+stats. The predictions table is rebuilt with AUTOINCREMENT so the id of an
+archived prediction is never handed out again. The full-text index now
+reads descriptions through prediction_history, a view over both tables;
+rebuilding predictions drops the triggers of 0005, so they are created
+again here together with the archive's own.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0008"
+down_revision: Union[str, Sequence[str], None] = "0007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = (
+    "id, description, creator_id, opponent_id, category_id, confidence, win_units, "
+    "loss_units, status, outcome, created_at, resolved_at, redeemed_at"
+)
+
+# The listing indexes of predictions, minus status: every archived row is REDEEMED
+ARCHIVE_INDEXES = {
+    "ix_archived_predictions_created_at_id": ["created_at", "id"],
+    "ix_archived_predictions_creator_created_at": ["creator_id", "created_at", "id"],
+    "ix_archived_predictions_opponent_created_at": ["opponent_id", "created_at", "id"],
+    "ix_archived_predictions_category_created_at": ["category_id", "created_at", "id"],
+}
+
+FTS_TRIGGERS = {
+    "predictions_fts_insert": """
+        CREATE TRIGGER predictions_fts_insert AFTER INSERT ON predictions BEGIN
+            INSERT INTO predictions_fts (rowid, description) VALUES (new.id, new.description);
+        END
+    """,
+    "predictions_fts_delete": """
+        CREATE TRIGGER predictions_fts_delete AFTER DELETE ON predictions BEGIN
+            INSERT INTO predictions_fts (predictions_fts, rowid, description)
+            VALUES ('delete', old.id, old.description);
+        END
+    """,
+    "predictions_fts_update": """
+        CREATE TRIGGER predictions_fts_update AFTER UPDATE OF description ON predictions BEGIN
+            INSERT INTO predictions_fts (predictions_fts, rowid, description)
+            VALUES ('delete', old.id, old.description);
+            INSERT INTO predictions_fts (rowid, description) VALUES (new.id, new.description);
+        END
+    """,
+}
+
+# Archived rows are only ever inserted and deleted
+ARCHIVE_FTS_TRIGGERS = {
+    "archived_predictions_fts_insert": """
+        CREATE TRIGGER archived_predictions_fts_insert AFTER INSERT ON archived_predictions BEGIN
+            INSERT INTO predictions_fts (rowid, description) VALUES (new.id, new.description);
+        END
+    """,
+    "archived_predictions_fts_delete": """
+        CREATE TRIGGER archived_predictions_fts_delete AFTER DELETE ON archived_predictions BEGIN
+            INSERT INTO predictions_fts (predictions_fts, rowid, description)
+            VALUES ('delete', old.id, old.description);
+        END
+    """,
+}
+
+
+def create_fts(content):
+    # Same index options as 0005
+    op.execute(
+        "CREATE VIRTUAL TABLE predictions_fts USING fts5("
+        f"description, content='{content}', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+
+
+def drop_fts(triggers):
+    for name in triggers:
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    op.execute("DROP TABLE predictions_fts")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    drop_fts(FTS_TRIGGERS)
+    with op.batch_alter_table(
+        "predictions", recreate="always", table_kwargs={"sqlite_autoincrement": True}
+    ):
+        pass
+
+    op.create_table(
+        "archived_predictions",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("description", sa.String(), nullable=True),
+        sa.Column("creator_id", sa.Integer(), nullable=True),
+        sa.Column("opponent_id", sa.Integer(), nullable=True),
+        sa.Column("category_id", sa.Integer(), nullable=True),
+        sa.Column("confidence", sa.Float(), nullable=True),
+        sa.Column("win_units", sa.Float(), nullable=True),
+        sa.Column("loss_units", sa.Float(), nullable=True),
+        sa.Column("status", sa.String(), nullable=True),
+        sa.Column("outcome", sa.Boolean(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("resolved_at", sa.DateTime(), nullable=True),
+        sa.Column("redeemed_at", sa.DateTime(), nullable=True),
+        sa.Column("archived_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["category_id"], ["categories.id"]),
+        sa.ForeignKeyConstraint(["creator_id"], ["users.id"]),
+        sa.ForeignKeyConstraint(["opponent_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    for name, columns in ARCHIVE_INDEXES.items():
+        op.create_index(name, "archived_predictions", columns)
+    op.create_table(
+        "archived_user_stats",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("category_id", sa.Integer(), nullable=False),
+        sa.Column("wins", sa.Integer(), nullable=False),
+        sa.Column("losses", sa.Integer(), nullable=False),
+        sa.Column("net_units", sa.Float(), nullable=False),
+        sa.Column("best_win_units", sa.Float(), nullable=True),
+        sa.Column("best_win_prediction_id", sa.Integer(), nullable=True),
+        sa.Column("best_win_description", sa.String(), nullable=True),
+        sa.Column("worst_loss_units", sa.Float(), nullable=True),
+        sa.Column("worst_loss_prediction_id", sa.Integer(), nullable=True),
+        sa.Column("worst_loss_description", sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("user_id", "category_id"),
+    )
+
+    op.execute(
+        f"CREATE VIEW prediction_history AS SELECT {COLUMNS} FROM predictions "
+        f"UNION ALL SELECT {COLUMNS} FROM archived_predictions"
+    )
+    create_fts("prediction_history")
+    for sql in [*FTS_TRIGGERS.values(), *ARCHIVE_FTS_TRIGGERS.values()]:
+        op.execute(sql)
+    op.execute("INSERT INTO predictions_fts (predictions_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    drop_fts([*FTS_TRIGGERS, *ARCHIVE_FTS_TRIGGERS])
+    op.execute("DROP VIEW prediction_history")
+    # Archived predictions go back to the live table, which the old user
+    # stats read in full again
+    op.execute(f"INSERT INTO predictions ({COLUMNS}) SELECT {COLUMNS} FROM archived_predictions")
+    op.drop_table("archived_user_stats")
+    for name in ARCHIVE_INDEXES:
+        op.drop_index(name, table_name="archived_predictions")
+    op.drop_table("archived_predictions")
+    with op.batch_alter_table(
+        "predictions", recreate="always", table_kwargs={"sqlite_autoincrement": False}
+    ):
+        pass
+
+    create_fts("predictions")
+    for sql in FTS_TRIGGERS.values():
+        op.execute(sql)
+    op.execute("INSERT INTO predictions_fts (predictions_fts) VALUES ('rebuild')")
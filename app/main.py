@@ -1,28 +1,97 @@
+import asyncio
+import datetime
+import logging
+
+import jinja2
+from decouple import config
 from fastapi import FastAPI, Request
-from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from app.database.database import engine, write_engine
 from app.database.init_db import init_db
-from app.routers import predictions, categories, users
+from app.routers import predictions, categories, users, events, maintenance, metrics as metrics_router
+from app.services import assets, cache, metrics, prerender, scheduler
+
+# uvicorn only configures its own loggers; give ours under "app" a handler too
+logging.getLogger("app").setLevel(config("LOG_LEVEL", default="INFO"))
+logging.getLogger("app").addHandler(logging.StreamHandler())
 
 app = FastAPI()
+# Added first so it runs inside the metrics middleware and cache hits are timed
+app.add_middleware(cache.ResponseCacheMiddleware)
+app.add_middleware(assets.CompressionMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(engine)
+metrics.instrument_engine(write_engine)
 
 app.include_router(predictions.router)
 app.include_router(categories.router)
 app.include_router(users.router)
+app.include_router(events.router)
+app.include_router(maintenance.router)
+app.include_router(metrics_router.router)
+
+# Compiled templates are kept on disk, so a restarted worker skips recompiling them
+templates = Jinja2Templates(
+    env=jinja2.Environment(
+        loader=jinja2.FileSystemLoader(assets.TEMPLATES_DIR),
+        autoescape=True,
+        bytecode_cache=jinja2.FileSystemBytecodeCache(),
+    )
+)
+templates.env.globals["asset_url"] = assets.asset_url
+
+# The first API responses each page needs, rendered into it so the page is
+# usable after one round trip; the URLs match what the page scripts request
+DASHBOARD_DATA = [
+    "/api/stats",
+    prerender.api_url(
+        "/api/predictions",
+        [("status", "PENDING"), ("status", "OPEN"), ("status", "RESOLVED"),
+         ("limit", 500), ("format", "compact")],
+    ),
+]
+HISTORY_DATA = [
+    prerender.api_url("/api/predictions", {"status": "REDEEMED", "limit": 30, "format": "compact"}),
+]
+NEW_PREDICTION_DATA = ["/api/users", "/api/categories"]
 
-templates = Jinja2Templates(directory="templates")
+
+def stats_data():
+    # The chart starts on the last year by week, counted in UTC days like the script
+    start = datetime.datetime.utcnow().date() - datetime.timedelta(days=365)
+    return [
+        "/api/stats",
+        prerender.api_url("/api/balance-history", {"granularity": "week", "start": start}),
+        "/api/calibration",
+        "/api/user-stats",
+    ]
+
+
+async def render_page(request, template, data_urls=()):
+    context = {"request": request}
+    if data_urls:
+        context["initial_data"] = await prerender.initial_data(request.app, data_urls)
+    return templates.TemplateResponse(template, context)
 
 @app.on_event("startup")
 async def on_startup():
     await init_db()
-app.mount("/static", StaticFiles(directory="static"), name="static")
+    app.state.background_tasks = [asyncio.create_task(cache.watch_writes())]
+    if scheduler.SCHEDULER_ENABLED:
+        app.state.background_tasks.append(asyncio.create_task(scheduler.run_scheduler()))
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    for task in app.state.background_tasks:
+        task.cancel()
+app.mount("/static", assets.VersionedStaticFiles(directory=assets.STATIC_DIR), name="static")
 
 @app.get("/")
 async def read_root(request: Request):
-    return templates.TemplateResponse("dashboard.html", {"request": request})
+    return await render_page(request, "dashboard.html", DASHBOARD_DATA)
 @app.get("/new")
 async def new_prediction(request: Request):
-    return templates.TemplateResponse("new_prediction.html", {"request": request})
+    return await render_page(request, "new_prediction.html", NEW_PREDICTION_DATA)
 @app.get("/manage-categories")
 async def manage_categories(request: Request):
     return templates.TemplateResponse("manage_categories.html", {"request": request})
@@ -32,8 +101,8 @@ async def manage_users(request: Request):
 
 @app.get("/stats")
 async def stats(request: Request):
-    return templates.TemplateResponse("stats.html", {"request": request})
+    return await render_page(request, "stats.html", stats_data())
 
 @app.get("/history")
 async def history(request: Request):
-    return templates.TemplateResponse("history.html", {"request": request})
+    return await render_page(request, "history.html", HISTORY_DATA)
@@ -0,0 +1,161 @@
+import argparse
+import asyncio
+import sys
+import time
+
+from app.database.database import SessionLocal, WriteSessionLocal
+from app.database.init_db import init_db
+from app.services import calibration, ledger, rollups, scheduler, search, stats
+
+
+async def migrate_command(args):
+    # init_db has already brought the schema up to date
+    print("Database schema is up to date.")
+    return 0
+
+
+async def ledger_command(args):
+    async with WriteSessionLocal() as session:
+        drift = await ledger.verify_ledger(session)
+        for debtor_id, creditor_id, stored, expected in drift:
+            print(
+                f"drift: debtor={debtor_id} creditor={creditor_id} "
+                f"stored={stored:.4f} expected={expected:.4f}"
+            )
+        if not drift:
+            print("Ledger is consistent with resolved predictions.")
+            return 0
+        if args.rebuild:
+            await ledger.rebuild_ledger(session)
+            await session.commit()
+            print(f"Rebuilt ledger ({len(drift)} pair(s) corrected).")
+            return 0
+        return 1
+
+
+async def calibration_command(args):
+    async with WriteSessionLocal() as session:
+        drift = await calibration.verify_calibration(session)
+        for (user_id, category_id, bucket), stored, expected in drift:
+            print(
+                f"drift: user={user_id} category={category_id} bucket={bucket} "
+                f"stored={stored} expected={expected}"
+            )
+        if not drift:
+            print("Calibration totals are consistent with decided predictions.")
+            return 0
+        if args.rebuild:
+            await calibration.rebuild_calibration(session)
+            await session.commit()
+            print(f"Rebuilt calibration totals ({len(drift)} bucket(s) corrected).")
+            return 0
+        return 1
+
+
+async def rollups_command(args):
+    async with WriteSessionLocal() as session:
+        drift = await rollups.verify_rollups(session)
+        for (day, user_a_id, user_b_id, category_id), stored, expected in drift:
+            print(
+                f"drift: day={day} users={user_a_id},{user_b_id} category={category_id} "
+                f"stored={stored} expected={expected}"
+            )
+        if not drift:
+            print("Daily rollups are consistent with settled predictions.")
+            return 0
+        if args.rebuild:
+            await rollups.rebuild_rollups(session)
+            await session.commit()
+            print(f"Rebuilt daily rollups ({len(drift)} row(s) corrected).")
+            return 0
+        return 1
+
+
+async def search_index_command(args):
+    async with WriteSessionLocal() as session:
+        started = time.perf_counter()
+        count = await search.rebuild_index(session)
+        await session.commit()
+    print(f"Indexed {count} prediction(s) in {time.perf_counter() - started:.1f} s.")
+    return 0
+
+
+async def job_command(args):
+    status, detail = await scheduler.run_job(scheduler.JOBS[args.name], force=True)
+    print(f"{args.name}: {status}: {detail}")
+    return 0 if status == "ok" else 1
+
+
+async def user_stats_command(args):
+    async with SessionLocal() as session:
+        actual = await stats.compute_user_stats(session)
+        expected = await stats.compute_user_stats_reference(session)
+    differences = stats.compare_user_stats(actual, expected)
+    for difference in differences:
+        print(f"mismatch: {difference}")
+    if differences:
+        return 1
+    print(f"SQL user stats match the reference implementation for {len(expected)} user(s).")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.manage")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subparsers.add_parser(
+        "migrate", help="Apply pending schema migrations, e.g. before starting several workers"
+    )
+    migrate_parser.set_defaults(handler=migrate_command)
+
+    ledger_parser = subparsers.add_parser(
+        "ledger", help="Verify the debt ledger against resolved predictions"
+    )
+    ledger_parser.add_argument(
+        "--rebuild", action="store_true", help="Recompute the ledger if drift is found"
+    )
+    ledger_parser.set_defaults(handler=ledger_command)
+
+    calibration_parser = subparsers.add_parser(
+        "calibration", help="Verify the calibration totals against decided predictions"
+    )
+    calibration_parser.add_argument(
+        "--rebuild", action="store_true", help="Recompute the totals if drift is found"
+    )
+    calibration_parser.set_defaults(handler=calibration_command)
+
+    rollups_parser = subparsers.add_parser(
+        "rollups", help="Verify the daily balance rollups against settled predictions"
+    )
+    rollups_parser.add_argument(
+        "--rebuild", action="store_true", help="Recompute the rollups if drift is found"
+    )
+    rollups_parser.set_defaults(handler=rollups_command)
+
+    search_index_parser = subparsers.add_parser(
+        "search-index", help="Rebuild the full-text search index from live and archived predictions"
+    )
+    search_index_parser.set_defaults(handler=search_index_command)
+
+    job_parser = subparsers.add_parser(
+        "job", help="Run a maintenance job now, e.g. a backup before an upgrade"
+    )
+    job_parser.add_argument("name", choices=list(scheduler.JOBS))
+    job_parser.set_defaults(handler=job_command)
+
+    user_stats_parser = subparsers.add_parser(
+        "user-stats", help="Check SQL user stats against the Python reference implementation"
+    )
+    user_stats_parser.set_defaults(handler=user_stats_command)
+
+    args = parser.parse_args(argv)
+
+    async def run():
+        await init_db()
+        return await args.handler(args)
+
+    return asyncio.run(run())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
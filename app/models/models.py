@@ -7,6 +7,8 @@ from sqlalchemy import (
     DateTime,
     Boolean,
     ForeignKey,
+    Index,
+    Date,
 )
 from sqlalchemy.orm import declarative_base, relationship
 
@@ -39,9 +41,131 @@ class Prediction(Base):
     opponent_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     category_id = Column(Integer, ForeignKey("categories.id"))
     confidence = Column(Float)
+    # Creator's payout in units if the event happens / loss if it does not,
+    # computed from the confidence by app.services.odds when the row is written
+    win_units = Column(Float)
+    loss_units = Column(Float)
     status = Column(String, default="PENDING")
     outcome = Column(Boolean, nullable=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    resolved_at = Column(DateTime, nullable=True)
+    redeemed_at = Column(DateTime, nullable=True)
     creator = relationship("User", back_populates="predictions", foreign_keys=[creator_id])
     opponent = relationship("User", foreign_keys=[opponent_id])
     category = relationship("Category", back_populates="predictions")
+    # Listings are filtered on one of these columns and paginated newest first
+    # by (created_at, id), so each filter gets a matching composite index.
+    # AUTOINCREMENT keeps SQLite from handing out the id of an archived
+    # prediction again.
+    __table_args__ = (
+        Index("ix_predictions_created_at_id", "created_at", "id"),
+        Index("ix_predictions_status_created_at", "status", "created_at", "id"),
+        Index("ix_predictions_creator_created_at", "creator_id", "created_at", "id"),
+        Index("ix_predictions_opponent_created_at", "opponent_id", "created_at", "id"),
+        Index("ix_predictions_category_created_at", "category_id", "created_at", "id"),
+        {"sqlite_autoincrement": True},
+    )
+
+
+class ArchivedPrediction(Base):
+    # Redeemed predictions moved out of the live table by app.services.archive,
+    # with their ids and columns unchanged; every row is REDEEMED
+    __tablename__ = "archived_predictions"
+    id = Column(Integer, primary_key=True)
+    description = Column(String)
+    creator_id = Column(Integer, ForeignKey("users.id"))
+    opponent_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    category_id = Column(Integer, ForeignKey("categories.id"))
+    confidence = Column(Float)
+    win_units = Column(Float)
+    loss_units = Column(Float)
+    status = Column(String)
+    outcome = Column(Boolean, nullable=True)
+    created_at = Column(DateTime)
+    resolved_at = Column(DateTime, nullable=True)
+    redeemed_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, nullable=False)
+    __table_args__ = (
+        Index("ix_archived_predictions_created_at_id", "created_at", "id"),
+        Index("ix_archived_predictions_creator_created_at", "creator_id", "created_at", "id"),
+        Index("ix_archived_predictions_opponent_created_at", "opponent_id", "created_at", "id"),
+        Index("ix_archived_predictions_category_created_at", "category_id", "created_at", "id"),
+    )
+
+
+class Balance(Base):
+    __tablename__ = "balances"
+    debtor_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    creditor_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    amount = Column(Float, nullable=False, default=0.0)
+
+
+class CalibrationBucket(Base):
+    # Running totals of decided predictions per creator, category and
+    # confidence bucket, maintained by app.services.calibration
+    __tablename__ = "calibration_buckets"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    # 0 stands for predictions whose category was deleted
+    category_id = Column(Integer, primary_key=True)
+    bucket = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    confidence_sum = Column(Float, nullable=False, default=0.0)
+    hits = Column(Integer, nullable=False, default=0)
+    brier_sum = Column(Float, nullable=False, default=0.0)
+    log_loss_sum = Column(Float, nullable=False, default=0.0)
+
+
+class DailyRollup(Base):
+    # Per-day totals for each pair of users (user_a_id < user_b_id) and
+    # category, maintained by app.services.rollups; amounts are signed from
+    # user A's side
+    __tablename__ = "daily_rollups"
+    day = Column(Date, primary_key=True)
+    user_a_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    user_b_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    # 0 stands for predictions whose category was deleted
+    category_id = Column(Integer, primary_key=True)
+    resolved_count = Column(Integer, nullable=False, default=0)
+    won_units = Column(Float, nullable=False, default=0.0)
+    paid_units = Column(Float, nullable=False, default=0.0)
+
+
+class ArchivedUserStats(Base):
+    # What archived predictions add to each user's stats, per category, so
+    # /api/user-stats does not have to read the archive (see
+    # app.services.archive); trophies break ties by the lowest prediction id
+    __tablename__ = "archived_user_stats"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    # 0 stands for predictions whose category was deleted
+    category_id = Column(Integer, primary_key=True)
+    wins = Column(Integer, nullable=False, default=0)
+    losses = Column(Integer, nullable=False, default=0)
+    net_units = Column(Float, nullable=False, default=0.0)
+    best_win_units = Column(Float, nullable=True)
+    best_win_prediction_id = Column(Integer, nullable=True)
+    best_win_description = Column(String, nullable=True)
+    worst_loss_units = Column(Float, nullable=True)
+    worst_loss_prediction_id = Column(Integer, nullable=True)
+    worst_loss_description = Column(String, nullable=True)
+
+
+class WriteCounter(Base):
+    # A single row bumped by every committed write transaction (see
+    # app.database.database), which each server process polls to notice
+    # writes made by other processes
+    __tablename__ = "write_counter"
+    id = Column(Integer, primary_key=True)
+    writes = Column(Integer, nullable=False, default=0)
+
+
+class JobRun(Base):
+    # Latest run of each maintenance job, shared by all server processes so
+    # only one of them runs a job when it falls due (see app.services.scheduler)
+    __tablename__ = "job_runs"
+    name = Column(String, primary_key=True)
+    started_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+    duration_seconds = Column(Float, nullable=True)
+    # running, ok or failed
+    status = Column(String, nullable=False)
+    detail = Column(String, nullable=True)
@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from app.database.database import get_db
+from app.database.database import get_db, get_write_db
 from app.models.models import Category
+from app.services import archive, calibration, reference, rollups
 from pydantic import BaseModel
 from typing import List
 
@@ -19,25 +20,30 @@ class CategoryOut(CategoryCreate):
 
 @router.post("/api/categories", response_model=CategoryOut)
 async def create_category(
-    category: CategoryCreate, db: AsyncSession = Depends(get_db)
+    category: CategoryCreate, db: AsyncSession = Depends(get_write_db)
 ):
     db_category = Category(**category.dict())
     db.add(db_category)
     await db.commit()
+    reference.categories.invalidate()
     await db.refresh(db_category)
     return db_category
 
 @router.get("/api/categories", response_model=List[CategoryOut])
-async def get_categories(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Category))
-    categories = result.scalars().all()
-    return categories
+async def get_categories(
+    db: AsyncSession = Depends(get_db)
+):
+    # ETags and conditional requests are handled by ResponseCacheMiddleware
+    categories = await reference.categories.load(db)
+    return [
+        {"id": category_id, "name": name} for category_id, name in categories.items()
+    ]
 
 @router.put("/api/categories/{category_id}", response_model=CategoryOut)
 async def update_category(
     category_id: int,
     category: CategoryCreate,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_write_db),
 ):
     result = await db.execute(select(Category).where(Category.id == category_id))
     db_category = result.scalars().first()
@@ -45,18 +51,27 @@ async def update_category(
         raise HTTPException(status_code=404, detail="Category not found")
     db_category.name = category.name
     await db.commit()
+    reference.categories.invalidate()
     await db.refresh(db_category)
     return db_category
 
 @router.delete("/api/categories/{category_id}", status_code=204)
 async def delete_category(
     category_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_write_db),
 ):
     result = await db.execute(select(Category).where(Category.id == category_id))
     db_category = result.scalars().first()
     if not db_category:
         raise HTTPException(status_code=404, detail="Category not found")
     await db.delete(db_category)
+    await archive.uncategorise(db, category_id)
+    await db.flush()
+    # The category's predictions are left uncategorised, which moves their
+    # calibration, rollup and archived stats totals to category 0
+    await calibration.rebuild_calibration(db)
+    await rollups.rebuild_rollups(db)
+    await archive.rebuild_user_stats(db)
     await db.commit()
+    reference.categories.invalidate()
     return
@@ -0,0 +1,43 @@
+import asyncio
+
+import orjson
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+
+from app.services import events
+
+router = APIRouter()
+
+# Comment lines keep idle connections open through proxies and let us notice
+# clients that went away
+KEEPALIVE_SECONDS = 15
+
+
+def format_event(event_type, data):
+    return b"event: " + event_type.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+@router.get("/api/events")
+async def stream_events(request: Request):
+    queue = events.bus.subscribe()
+
+    async def event_stream():
+        try:
+            yield b"retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event_type, data = await asyncio.wait_for(
+                        queue.get(), timeout=KEEPALIVE_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                yield format_event(event_type, data)
+        finally:
+            events.bus.unsubscribe(queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,39 @@
+import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.database import get_db
+from app.services import scheduler
+
+router = APIRouter()
+
+
+class JobStatus(BaseModel):
+    name: str
+    interval_seconds: float
+    # None until the job has run once
+    status: Optional[str]
+    started_at: Optional[datetime.datetime]
+    finished_at: Optional[datetime.datetime]
+    duration_seconds: Optional[float]
+    detail: Optional[str]
+    next_run_at: Optional[datetime.datetime]
+
+class BackupFile(BaseModel):
+    name: str
+    size_bytes: int
+    created_at: datetime.datetime
+
+class MaintenanceStatus(BaseModel):
+    scheduler_enabled: bool
+    jobs: List[JobStatus]
+    backups: List[BackupFile]
+
+
+@router.get("/api/maintenance", response_model=MaintenanceStatus)
+async def get_maintenance_status(db: AsyncSession = Depends(get_db)):
+    status = await scheduler.get_status(db)
+    return {"scheduler_enabled": scheduler.SCHEDULER_ENABLED, **status}
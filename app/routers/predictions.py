@@ -1,13 +1,29 @@
 import datetime
-from typing import List, Optional
+from typing import List, Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from sqlalchemy import and_, case, or_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
-from app.database.database import get_db
-from app.models.models import Category, Prediction, User
+from app.database.database import SessionLocal, get_db, get_write_db
+from app.models.models import Prediction
+from app.services import (
+    archive,
+    calibration,
+    events,
+    ledger,
+    listing,
+    mutations,
+    odds,
+    rollups,
+    search,
+    simulation,
+    stats,
+    transfer,
+)
 
 from sqlalchemy.orm import selectinload
 
@@ -22,7 +38,8 @@ class UserOut(BaseModel):
 class PredictionCreate(BaseModel):
     creator_id: int
     description: str
-    confidence: float
+    # The odds are undefined at exactly 0 or 1
+    confidence: float = Field(..., gt=0, lt=1)
     category_id: int
 
 class CategoryOut(BaseModel):
@@ -36,8 +53,14 @@ class PredictionOut(PredictionCreate):
     status: str
     outcome: Optional[bool]
     created_at: datetime.datetime
+    resolved_at: Optional[datetime.datetime] = None
+    redeemed_at: Optional[datetime.datetime] = None
+    win_units: Optional[float] = None
+    loss_units: Optional[float] = None
+    # Deleting a category leaves its predictions without one
+    category_id: Optional[int] = None
     creator: UserOut
-    category: CategoryOut
+    category: Optional[CategoryOut] = None
     opponent: Optional[UserOut] = None
     class Config:
         orm_mode = True
@@ -45,33 +68,46 @@ class PredictionOut(PredictionCreate):
 class PredictionAccept(BaseModel):
     user_id: int
 
+async def publish_change(prediction=None, deleted_id=None, balances_changed=False):
+    # Push a committed change to connected dashboards as a small delta
+    if not events.bus.has_subscribers:
+        return
+    if prediction is not None:
+        event_type, data = "prediction", {"prediction": prediction}
+    else:
+        event_type, data = "prediction_deleted", {"id": deleted_id}
+    if balances_changed:
+        # On a read connection: a statement on the committed write session
+        # would begin a new transaction and take the write lock again
+        async with SessionLocal() as read_db:
+            data["balances"] = await ledger.get_balances(read_db)
+    events.bus.publish(event_type, data)
+
 @router.post("/api/predictions/{prediction_id}/accept", response_model=PredictionOut)
 async def accept_prediction(
     prediction_id: int,
     acceptance: PredictionAccept,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_write_db),
 ):
-
-    result = await db.execute(select(Prediction).where(Prediction.id == prediction_id))
-    db_prediction = result.scalars().first()
-    if not db_prediction:
-        raise HTTPException(status_code=404, detail="Prediction not found")
-    if db_prediction.status != "PENDING":
-        raise HTTPException(status_code=400, detail="This bet is not pending acceptance.")
-    if db_prediction.creator_id == acceptance.user_id:
+    # The status and creator checks are part of the UPDATE, so two people
+    # tapping "accept" at the same time cannot both succeed
+    row = await mutations.update_prediction(
+        db,
+        prediction_id,
+        {"opponent_id": acceptance.user_id, "status": "OPEN"},
+        Prediction.status == "PENDING",
+        Prediction.creator_id != acceptance.user_id,
+    )
+    if row is None:
+        current = await mutations.current_state(db, prediction_id)
+        if current is None:
+            raise HTTPException(status_code=404, detail="Prediction not found")
+        if current.status != "PENDING":
+            raise HTTPException(status_code=400, detail="This bet is not pending acceptance.")
         raise HTTPException(status_code=400, detail="You cannot accept your own bet.")
-    db_prediction.opponent_id = acceptance.user_id
-    db_prediction.status = "OPEN"
+    accepted_prediction = await mutations.prediction_out(db, row)
     await db.commit()
-    # Re-fetch the prediction with the relationships loaded
-
-    result = await db.execute(
-        select(Prediction)
-        .options(selectinload(Prediction.creator), selectinload(Prediction.category), selectinload(Prediction.opponent))
-        .where(Prediction.id == db_prediction.id)
-    )
-
-    accepted_prediction = result.scalars().first()
+    await publish_change(prediction=accepted_prediction)
     return accepted_prediction
 
 class PredictionResolve(BaseModel):
@@ -79,145 +115,480 @@ class PredictionResolve(BaseModel):
 
 @router.post("/api/predictions", response_model=PredictionOut)
 async def create_prediction(
-    prediction: PredictionCreate, db: AsyncSession = Depends(get_db)
+    prediction: PredictionCreate, db: AsyncSession = Depends(get_write_db)
 ):
-
-    db_prediction = Prediction(**prediction.dict())
-    db.add(db_prediction)
+    row = await mutations.insert_prediction(db, prediction.dict())
+    new_prediction = await mutations.prediction_out(db, row)
     await db.commit()
-    # Re-fetch the prediction with the relationships loaded
-
-    result = await db.execute(
-        select(Prediction)
-        .options(selectinload(Prediction.creator), selectinload(Prediction.category), selectinload(Prediction.opponent))
-        .where(Prediction.id == db_prediction.id)
-    )
-
-    new_prediction = result.scalars().first()
+    await publish_change(prediction=new_prediction)
     return new_prediction
 
 @router.delete("/api/predictions/{prediction_id}", status_code=204)
-async def delete_prediction(prediction_id: int, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(
-        select(Prediction).where(Prediction.id == prediction_id)
-    )
-    db_prediction = result.scalars().first()
-    if not db_prediction:
-        raise HTTPException(status_code=404, detail="Prediction not found")
-
-    await db.delete(db_prediction)
+async def delete_prediction(prediction_id: int, db: AsyncSession = Depends(get_write_db)):
+    row = await mutations.delete_prediction(db, prediction_id)
+    if row is None:
+        if await mutations.current_state(db, prediction_id) is None:
+            raise HTTPException(status_code=404, detail="Prediction not found")
+        raise HTTPException(status_code=400, detail="Archived bets cannot be deleted.")
+
+    entry = ledger.ledger_entry(row)
+    await ledger.post_entries(db, [entry], sign=-1.0)
+    await calibration.post_entries(db, [row], sign=-1)
+    await rollups.post_entries(db, rollups.rollup_entries(row), sign=-1)
     await db.commit()
+    await publish_change(deleted_id=prediction_id, balances_changed=entry is not None)
     return
 
+def prediction_filters(
+    status: Optional[List[str]] = Query(None),
+    category_id: Optional[int] = None,
+    creator_id: Optional[int] = None,
+    opponent_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    created_after: Optional[datetime.datetime] = None,
+    created_before: Optional[datetime.datetime] = None,
+    q: Optional[str] = None,
+):
+    return listing.PredictionFilters(
+        status=status,
+        category_id=category_id,
+        creator_id=creator_id,
+        opponent_id=opponent_id,
+        user_id=user_id,
+        created_after=created_after,
+        created_before=created_before,
+        q=q,
+    )
+
 @router.get("/api/predictions", response_model=List[PredictionOut])
-async def get_predictions(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(
+async def get_predictions(
+    response: Response,
+    filters: listing.PredictionFilters = Depends(prediction_filters),
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=listing.MAX_PAGE_SIZE),
+    format: Literal["full", "compact", "columnar"] = "full",
+    db: AsyncSession = Depends(get_db),
+):
+    # Callers from before pagination ask for the full format with neither a
+    # limit nor a cursor, and still get every prediction in one response
+    if limit is None and (format != "full" or cursor is not None):
+        limit = listing.DEFAULT_PAGE_SIZE
+    if format != "full":
+        return await get_compact_predictions(filters, cursor, limit, format == "columnar", db)
+    try:
+        page = listing.page(listing.FIELDS, filters, cursor, limit)
+    except listing.InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # Archived rows have the same columns, so they load as Prediction objects too
+    stmt = (
         select(Prediction)
+        .from_statement(page)
         .options(selectinload(Prediction.creator), selectinload(Prediction.category), selectinload(Prediction.opponent))
     )
-    predictions = result.scalars().all()
+    result = await db.execute(stmt)
+    predictions, next_cursor = listing.split_page(result.scalars().all(), limit)
+    # The body stays a plain list; the next page is advertised in a header
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return predictions
 
+async def get_compact_predictions(filters, cursor, limit, columnar, db):
+    # Plain column tuples straight from Core, no ORM objects or per-row
+    # Pydantic validation; names are sent once in side tables
+    try:
+        stmt = listing.page(listing.COMPACT_FIELDS, filters, cursor, limit)
+    except listing.InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    result = await db.execute(stmt)
+    rows, next_cursor = listing.split_page(result.all(), limit)
+    payload = await listing.compact_payload(db, rows, columnar=columnar)
+    payload["next_cursor"] = next_cursor
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return ORJSONResponse(payload, headers=headers)
+
+@router.get("/api/predictions/search")
+async def search_predictions(
+    filters: listing.PredictionFilters = Depends(prediction_filters),
+    limit: int = Query(20, ge=1, le=listing.MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_db),
+):
+    # Best matches first, in the compact format with a highlighted snippet
+    # column; the other listing filters narrow the matches as usual
+    query = search.match_query(filters.q or "")
+    if query is None:
+        raise HTTPException(status_code=400, detail="Enter some words to search for.")
+    fts = search.predictions_fts
+    other_filters = filters.copy(update={"q": None})
+
+    def statement(table):
+        stmt = (
+            select(
+                *listing.columns(table, listing.COMPACT_FIELDS),
+                search.snippet().label("snippet"),
+                fts.c.rank,
+            )
+            .select_from(search.join(table))
+            .where(search.match(query))
+        )
+        return listing.apply_filters(stmt, other_filters, table)
+
+    # Archived matches come from the same index, so all ranks compare. The
+    # union is ordered as a whole, so SQLite merges the two sorted arms and
+    # only builds snippets for the rows it returns
+    stmt = archive.history(statement, listing.includes_archive(filters))
+    selected = stmt.selected_columns
+    stmt = stmt.order_by(selected.rank, selected.id.desc()).limit(limit + 1).offset(offset)
+    result = await db.execute(stmt)
+    rows = result.all()
+    next_offset = offset + limit if len(rows) > limit else None
+    payload = await listing.compact_payload(db, rows[:limit], extra_columns=("snippet",))
+    # The rank column only served the ordering
+    payload["rows"] = [(*row[:-2], search.highlight(row[-2])) for row in payload["rows"]]
+    payload["next_offset"] = next_offset
+    return ORJSONResponse(payload)
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+@router.get("/api/predictions/export")
+async def export_predictions(
+    filters: listing.PredictionFilters = Depends(prediction_filters),
+    format: Literal["ndjson", "csv"] = "ndjson",
+):
+    # Streamed in batches from a server-side cursor, so memory use does not
+    # grow with the size of the history
+    return StreamingResponse(
+        transfer.export_predictions(filters, format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="predictions.{format}"'},
+    )
+
+class ImportResult(BaseModel):
+    imported: int
+    error_count: int
+    errors: List[dict]
+
+@router.post("/api/predictions/import", response_model=ImportResult)
+async def import_predictions(
+    request: Request,
+    format: Optional[Literal["ndjson", "csv"]] = None,
+    db: AsyncSession = Depends(get_write_db),
+):
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = "csv" if content_type.startswith("text/csv") else "ndjson"
+    result = await transfer.import_predictions(db, request.stream(), format)
+    if result["imported"] and events.bus.has_subscribers:
+        # Too many changes to send as deltas; let dashboards reload instead
+        events.bus.publish("resync", {})
+    return result
+
 @router.post("/api/predictions/{prediction_id}/resolve", response_model=PredictionOut)
 async def resolve_prediction(
     prediction_id: int,
     prediction_resolve: PredictionResolve,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_write_db),
 ):
-
-    result = await db.execute(select(Prediction).where(Prediction.id == prediction_id))
-    db_prediction = result.scalars().first()
-    if not db_prediction:
-        raise HTTPException(status_code=404, detail="Prediction not found")
-    db_prediction.outcome = prediction_resolve.outcome
-    db_prediction.status = "RESOLVED"
-    await db.commit()
-    # Re-fetch the prediction with the relationships loaded
-
-    result = await db.execute(
-        select(Prediction)
-        .options(selectinload(Prediction.creator), selectinload(Prediction.category), selectinload(Prediction.opponent))
-        .where(Prediction.id == db_prediction.id)
+    row = await mutations.update_prediction(
+        db,
+        prediction_id,
+        {
+            "outcome": prediction_resolve.outcome,
+            "status": "RESOLVED",
+            "resolved_at": datetime.datetime.utcnow(),
+        },
+        Prediction.status == "OPEN",
     )
-
-    resolved_prediction = result.scalars().first()
+    if row is None:
+        if await mutations.current_state(db, prediction_id) is None:
+            raise HTTPException(status_code=404, detail="Prediction not found")
+        raise HTTPException(status_code=400, detail="This bet is not open.")
+    await ledger.post_entries(db, [ledger.ledger_entry(row)])
+    await calibration.post_entries(db, [row])
+    await rollups.post_entries(db, [rollups.resolve_entry(row)])
+    resolved_prediction = await mutations.prediction_out(db, row)
+    await db.commit()
+    await publish_change(prediction=resolved_prediction, balances_changed=True)
     return resolved_prediction
 
 @router.post("/api/predictions/{prediction_id}/redeem", response_model=PredictionOut)
 async def redeem_prediction(
     prediction_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_write_db),
 ):
+    row = await mutations.update_prediction(
+        db,
+        prediction_id,
+        {"status": "REDEEMED", "redeemed_at": datetime.datetime.utcnow()},
+        Prediction.status == "RESOLVED",
+    )
+    if row is None:
+        if await mutations.current_state(db, prediction_id) is None:
+            raise HTTPException(status_code=404, detail="Prediction not found")
+        raise HTTPException(status_code=400, detail="This bet has not been resolved.")
+    # The row was RESOLVED until this statement, so its debt is now paid
+    await ledger.post_entries(db, [ledger.settlement_entry(row)], sign=-1.0)
+    await rollups.post_entries(db, [rollups.redeem_entry(row)])
+    redeemed_prediction = await mutations.prediction_out(db, row)
+    await db.commit()
+    await publish_change(prediction=redeemed_prediction, balances_changed=True)
+    return redeemed_prediction
+
+# Keeps the id lists well inside SQLite's bound parameter limit
+MAX_BATCH_SIZE = 500
+
+class PredictionResolution(BaseModel):
+    id: int
+    outcome: bool
 
-    result = await db.execute(select(Prediction).where(Prediction.id == prediction_id))
-    db_prediction = result.scalars().first()
-    if not db_prediction:
-        raise HTTPException(status_code=404, detail="Prediction not found")
-    db_prediction.status = "REDEEMED"
+class BatchResolve(BaseModel):
+    resolutions: List[PredictionResolution]
+
+class BatchRedeem(BaseModel):
+    ids: Optional[List[int]] = None
+    # Every resolved bet between these two users, whoever created it
+    user_ids: Optional[List[int]] = None
+    category_id: Optional[int] = None
+
+class BatchResult(BaseModel):
+    predictions: List[PredictionOut]
+    # Requested ids that did not exist or were not in the required state
+    skipped: List[int]
+    balances: List[dict]
+
+async def finish_batch(db, rows, requested_ids, sign):
+    entries = [ledger.settlement_entry(row) for row in rows]
+    await ledger.post_entries(db, entries, sign=sign)
+    if sign > 0:
+        # Resolving decides the bets; redeeming leaves calibration unchanged
+        await calibration.post_entries(db, rows)
+        await rollups.post_entries(db, [rollups.resolve_entry(row) for row in rows])
+    else:
+        await rollups.post_entries(db, [rollups.redeem_entry(row) for row in rows])
+    changed = [await mutations.prediction_out(db, row) for row in rows]
+    # Read inside the transaction: after the commit the next statement on the
+    # writer would begin a new one and take the write lock again
+    balances = await ledger.get_balances(db)
     await db.commit()
-    # Re-fetch the prediction with the relationships loaded
+    if changed and events.bus.has_subscribers:
+        events.bus.publish("predictions", {"predictions": changed, "balances": balances})
+    updated_ids = {row.id for row in rows}
+    return {
+        "predictions": changed,
+        "skipped": [i for i in requested_ids if i not in updated_ids],
+        "balances": balances,
+    }
 
-    result = await db.execute(
-        select(Prediction)
-        .options(selectinload(Prediction.creator), selectinload(Prediction.category), selectinload(Prediction.opponent))
-        .where(Prediction.id == db_prediction.id)
+@router.post("/api/predictions/resolve", response_model=BatchResult)
+async def resolve_predictions(batch: BatchResolve, db: AsyncSession = Depends(get_write_db)):
+    if len(batch.resolutions) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} predictions per batch.")
+    outcomes = {r.id: r.outcome for r in batch.resolutions}
+    rows = []
+    if outcomes:
+        # One UPDATE for the whole batch, each row picking its own outcome
+        rows = await mutations.update_predictions(
+            db,
+            {
+                "outcome": case(outcomes, value=Prediction.id),
+                "status": "RESOLVED",
+                "resolved_at": datetime.datetime.utcnow(),
+            },
+            Prediction.id.in_(outcomes),
+            Prediction.status == "OPEN",
+        )
+    return await finish_batch(db, rows, list(outcomes), sign=1.0)
+
+@router.post("/api/predictions/redeem", response_model=BatchResult)
+async def redeem_predictions(batch: BatchRedeem, db: AsyncSession = Depends(get_write_db)):
+    conditions = []
+    if batch.ids is not None:
+        if len(batch.ids) > MAX_BATCH_SIZE:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} predictions per batch.")
+        conditions.append(Prediction.id.in_(batch.ids))
+    if batch.user_ids is not None:
+        if len(set(batch.user_ids)) != 2:
+            raise HTTPException(status_code=400, detail="user_ids must name two different users.")
+        first, second = batch.user_ids
+        conditions.append(
+            or_(
+                and_(Prediction.creator_id == first, Prediction.opponent_id == second),
+                and_(Prediction.creator_id == second, Prediction.opponent_id == first),
+            )
+        )
+    if batch.category_id is not None:
+        conditions.append(Prediction.category_id == batch.category_id)
+    if not conditions:
+        raise HTTPException(status_code=400, detail="Choose predictions by ids, user_ids or category_id.")
+    rows = await mutations.update_predictions(
+        db,
+        {"status": "REDEEMED", "redeemed_at": datetime.datetime.utcnow()},
+        Prediction.status == "RESOLVED",
+        *conditions,
     )
-
-    redeemed_prediction = result.scalars().first()
-    return redeemed_prediction
-from collections import defaultdict
+    # Every row was RESOLVED until this statement, so its debt is now paid
+    return await finish_batch(db, rows, batch.ids or [], sign=-1.0)
 
 @router.get("/api/stats")
 async def get_stats(db: AsyncSession = Depends(get_db)):
-    # Get all users for name mapping
-    user_result = await db.execute(select(User))
-    users = user_result.scalars().all()
-    user_map = {user.id: user.name for user in users}
-    # Get all resolved predictions
-    prediction_result = await db.execute(
-        select(Prediction).where(Prediction.status == "RESOLVED")
-    )
-    predictions = prediction_result.scalars().all()
-    
-    # Calculate gross debts
-    debts = defaultdict(float) # Key: (debtor_id, creditor_id)
-    for p in predictions:
-        # Skip predictions that don't have an opponent
-        if p.opponent_id is None:
-            continue
-        if p.confidence >= 0.5:
-            odds_ratio = p.confidence / (1 - p.confidence)
-            if p.outcome:  # Creator wins
-                debtor_id = p.opponent_id
-                creditor_id = p.creator_id
-                amount = 1.0
-            else:  # Creator loses
-                debtor_id = p.creator_id
-                creditor_id = p.opponent_id
-                amount = odds_ratio
-        else:  # p.confidence < 0.5
-            odds_ratio = (1 - p.confidence) / p.confidence
-            if p.outcome:  # Creator wins
-                debtor_id = p.opponent_id
-                creditor_id = p.creator_id
-                amount = odds_ratio
-            else:  # Creator loses
-                debtor_id = p.creator_id
-                creditor_id = p.opponent_id
-                amount = 1.0
-        
-        debts[(debtor_id, creditor_id)] += amount
-    # Format the response
-    formatted_debts = [
-        {
-            "debtor": user_map.get(debtor_id, "Unknown"),
-            "creditor": user_map.get(creditor_id, "Unknown"),
-            "amount": round(amount, 2),
-        }
-        for (debtor_id, creditor_id), amount in debts.items() if amount > 0
+    # Debts are maintained incrementally by the mutation endpoints, so this
+    # only reads one row per (debtor, creditor) pair
+    return await ledger.get_balances(db)
+
+class Payout(BaseModel):
+    confidence: float
+    win_units: float
+    loss_units: float
+
+@router.get("/api/payouts", response_model=List[Payout])
+async def get_payouts(confidence: List[float] = Query(...)):
+    # What-if preview of the stakes at any number of confidences
+    if any(not 0 < c < 1 for c in confidence):
+        raise HTTPException(status_code=400, detail="Confidence must be between 0 and 1.")
+    win_units, loss_units = odds.payouts_array(confidence)
+    return [
+        {"confidence": c, "win_units": w, "loss_units": l}
+        for c, w, l in zip(confidence, win_units.tolist(), loss_units.tolist())
     ]
 
-    return formatted_debts
+class CalibrationBucketOut(BaseModel):
+    bucket: int
+    lower: float
+    upper: float
+    count: int
+    mean_confidence: float
+    observed_rate: float
+
+class CalibrationSummary(BaseModel):
+    count: int
+    brier_score: float
+    log_loss: float
+    mean_confidence: float
+    hit_rate: float
+    buckets: List[CalibrationBucketOut]
+
+class NamedCalibration(CalibrationSummary):
+    id: int
+    name: str
+
+class CalibrationOut(BaseModel):
+    overall: Optional[CalibrationSummary] = None
+    users: List[NamedCalibration]
+    categories: List[NamedCalibration]
+
+@router.get("/api/calibration", response_model=CalibrationOut)
+async def get_calibration(db: AsyncSession = Depends(get_db)):
+    # Read from running totals per (creator, category, bucket), so the cost
+    # does not grow with the number of decided predictions
+    return await calibration.get_calibration(db)
+
+class BalancePoint(BaseModel):
+    period: str
+    resolved: int
+    won_units: float
+    net_won_units: float
+    balance: float
+
+class PairHistory(BaseModel):
+    user_a: UserOut
+    user_b: UserOut
+    points: List[BalancePoint]
+
+class CategoryPoint(BaseModel):
+    period: str
+    resolved: int
+
+class CategoryHistory(BaseModel):
+    id: int
+    name: str
+    points: List[CategoryPoint]
+
+class BalanceHistory(BaseModel):
+    granularity: str
+    pairs: List[PairHistory]
+    categories: List[CategoryHistory]
+
+@router.get("/api/balance-history", response_model=BalanceHistory)
+async def get_balance_history(
+    granularity: Literal["day", "week", "month"] = "day",
+    start: Optional[datetime.date] = None,
+    end: Optional[datetime.date] = None,
+    user_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    # Served from per-day rollups, so the cost follows the number of days
+    # in the range rather than the number of bets
+    return await rollups.get_balance_history(db, granularity, start, end, user_id)
+
+class PercentileOut(BaseModel):
+    percentile: int
+    units: float
+
+class UserProjection(BaseModel):
+    id: int
+    name: str
+    bets: int
+    expected_units: float
+    std_units: float
+    percentiles: List[PercentileOut]
+    loss_probability: float
+    value_at_risk: float
+    expected_shortfall: float
+
+class Histogram(BaseModel):
+    edges: List[float]
+    counts: List[int]
+
+class PairProjection(BaseModel):
+    user_a: UserOut
+    user_b: UserOut
+    bets: int
+    current_balance: float
+    expected_balance: float
+    std_units: float
+    percentiles: List[PercentileOut]
+    histogram: Histogram
+
+class PricedBet(BaseModel):
+    creator: UserOut
+    confidence: float
+    probability: float
+    decided_bets: int
+    win_units: float
+    loss_units: float
+    expected_units: float
+
+class SimulationOut(BaseModel):
+    trials: int
+    bets: int
+    users: List[UserProjection]
+    pairs: List[PairProjection]
+    proposal: Optional[PricedBet] = None
+
+@router.get("/api/simulate", response_model=SimulationOut)
+async def simulate(
+    user_id: Optional[int] = None,
+    trials: int = Query(simulation.DEFAULT_TRIALS, ge=1000, le=simulation.MAX_TRIALS),
+    creator_id: Optional[int] = None,
+    opponent_id: Optional[int] = None,
+    confidence: Optional[float] = Query(None, gt=0, lt=1),
+    db: AsyncSession = Depends(get_db),
+):
+    # Monte Carlo projection of the open bets from their creators' calibration;
+    # `confidence` with `creator_id` also prices a bet that is not placed yet
+    if (confidence is None) != (creator_id is None):
+        raise HTTPException(
+            status_code=400, detail="Pricing a bet needs both creator_id and confidence."
+        )
+    if opponent_id is not None and confidence is None:
+        raise HTTPException(
+            status_code=400, detail="opponent_id only applies to a bet being priced."
+        )
+    if opponent_id is not None and opponent_id == creator_id:
+        raise HTTPException(status_code=400, detail="The opponent cannot be the creator.")
+    return await simulation.get_simulation(
+        db, user_id, trials, creator_id, opponent_id, confidence
+    )
 
 class TrophyPrediction(BaseModel):
     description: str
@@ -237,96 +608,8 @@ class UserStats(BaseModel):
     worst_beat: Optional[TrophyPrediction] = None
     by_category: dict[str, CategoryStat]
 
-def calculate_units(prediction: Prediction):
-    if prediction.confidence >= 0.5:
-        odds_ratio = prediction.confidence / (1 - prediction.confidence)
-        if prediction.outcome: # Creator wins
-            return 1.0
-        else: # Creator loses
-            return -odds_ratio
-    else: # prediction.confidence < 0.5
-        odds_ratio = (1 - prediction.confidence) / prediction.confidence
-        if prediction.outcome: # Creator wins
-            return odds_ratio
-        else: # Creator loses
-            return -1.0
-
 @router.get("/api/user-stats", response_model=list[UserStats])
 async def get_user_stats(db: AsyncSession = Depends(get_db)):
-    users_result = await db.execute(select(User))
-    users = users_result.scalars().all()
-
-    predictions_result = await db.execute(
-        select(Prediction)
-        .where(Prediction.status.in_(["RESOLVED", "REDEEMED"]))
-        .options(
-            selectinload(Prediction.creator),
-            selectinload(Prediction.opponent),
-            selectinload(Prediction.category),
-        )
-    )
-    predictions = predictions_result.scalars().all()
-
-    stats = {
-        user.id: UserStats(
-            id=user.id,
-            name=user.name,
-            wins=0,
-            losses=0,
-            net_units=0.0,
-            by_category={},
-        )
-        for user in users
-    }
-
-    for p in predictions:
-        if p.opponent_id is None:
-            continue
-
-        units_for_creator = calculate_units(p)
-        
-        # Update stats for creator
-        stats[p.creator_id].net_units += units_for_creator
-        if units_for_creator > 0:
-            stats[p.creator_id].wins += 1
-            if not stats[p.creator_id].biggest_upset or units_for_creator > stats[p.creator_id].biggest_upset.units:
-                stats[p.creator_id].biggest_upset = TrophyPrediction(description=p.description, units=units_for_creator)
-        else:
-            stats[p.creator_id].losses += 1
-            if not stats[p.creator_id].worst_beat or units_for_creator < stats[p.creator_id].worst_beat.units:
-                 stats[p.creator_id].worst_beat = TrophyPrediction(description=p.description, units=units_for_creator)
-
-        # Update stats for opponent
-        stats[p.opponent_id].net_units -= units_for_creator
-        if units_for_creator < 0:
-             stats[p.opponent_id].wins += 1
-             if not stats[p.opponent_id].biggest_upset or -units_for_creator > stats[p.opponent_id].biggest_upset.units:
-                 stats[p.opponent_id].biggest_upset = TrophyPrediction(description=p.description, units=-units_for_creator)
-        else:
-            stats[p.opponent_id].losses += 1
-            if not stats[p.opponent_id].worst_beat or -units_for_creator < stats[p.opponent_id].worst_beat.units:
-                 stats[p.opponent_id].worst_beat = TrophyPrediction(description=p.description, units=-units_for_creator)
-
-
-        # --- W/L by Category (no change from before) ---
-        category_name = p.category.name
-        creator_wins = p.outcome
-        opponent_wins = not p.outcome
-
-        # Creator category stats
-        if category_name not in stats[p.creator_id].by_category:
-            stats[p.creator_id].by_category[category_name] = CategoryStat(wins=0, losses=0)
-        if creator_wins:
-            stats[p.creator_id].by_category[category_name].wins += 1
-        else:
-            stats[p.creator_id].by_category[category_name].losses += 1
-        
-        # Opponent category stats
-        if category_name not in stats[p.opponent_id].by_category:
-            stats[p.opponent_id].by_category[category_name] = CategoryStat(wins=0, losses=0)
-        if opponent_wins:
-            stats[p.opponent_id].by_category[category_name].wins += 1
-        else:
-            stats[p.opponent_id].by_category[category_name].losses += 1
-
-    return list(stats.values())
+    # Aggregated in SQLite; see stats.compute_user_stats_reference for the
+    # row-by-row definition these numbers must match
+    return await stats.compute_user_stats(db)
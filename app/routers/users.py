@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from app.database.database import get_db
+from app.database.database import get_db, get_write_db
 from app.models.models import User
+from app.services import archive, calibration, ledger, reference, rollups
 from pydantic import BaseModel
 from typing import List
 
@@ -18,22 +19,25 @@ class UserOut(UserCreate):
         orm_mode = True
 
 @router.get("/api/users", response_model=List[UserOut])
-async def get_users(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(User))
-    users = result.scalars().all()
-    return users
+async def get_users(
+    db: AsyncSession = Depends(get_db)
+):
+    # ETags and conditional requests are handled by ResponseCacheMiddleware
+    users = await reference.users.load(db)
+    return [{"id": user_id, "name": name} for user_id, name in users.items()]
 
 @router.post("/api/users", response_model=UserOut)
-async def create_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_write_db)):
     db_user = User(**user.dict())
     db.add(db_user)
     await db.commit()
+    reference.users.invalidate()
     await db.refresh(db_user)
     return db_user
 
 @router.put("/api/users/{user_id}", response_model=UserOut)
 async def update_user(
-    user_id: int, user: UserCreate, db: AsyncSession = Depends(get_db)
+    user_id: int, user: UserCreate, db: AsyncSession = Depends(get_write_db)
 ):
     result = await db.execute(select(User).where(User.id == user_id))
     db_user = result.scalars().first()
@@ -41,15 +45,25 @@ async def update_user(
         raise HTTPException(status_code=404, detail="User not found")
     db_user.name = user.name
     await db.commit()
+    reference.users.invalidate()
     await db.refresh(db_user)
     return db_user
 
 @router.delete("/api/users/{user_id}", status_code=204)
-async def delete_user(user_id: int, db: AsyncSession = Depends(get_db)):
+async def delete_user(user_id: int, db: AsyncSession = Depends(get_write_db)):
     result = await db.execute(select(User).where(User.id == user_id))
     db_user = result.scalars().first()
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
     await db.delete(db_user)
+    await archive.delete_user_predictions(db, user_id)
+    await db.flush()
+    # Deleting a user cascades to their predictions; user deletion is rare
+    # enough that recomputing the derived tables is simpler than unwinding each bet
+    await ledger.rebuild_ledger(db)
+    await calibration.rebuild_calibration(db)
+    await rollups.rebuild_rollups(db)
+    await archive.rebuild_user_stats(db)
     await db.commit()
+    reference.users.invalidate()
     return
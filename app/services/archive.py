@@ -0,0 +1,232 @@
+import datetime
+from collections import defaultdict
+
+from decouple import config
+from sqlalchemy import delete, func, insert, select, union_all, update
+
+from app.database.database import WriteSessionLocal
+from app.models.models import ArchivedPrediction, ArchivedUserStats, Prediction
+from app.services import odds
+
+# Redeemed bets are settled and never change again; once they are this old
+# they move out of the table the dashboard and the mutations work on
+ARCHIVE_AFTER_DAYS = config("ARCHIVE_AFTER_DAYS", default=90, cast=int)
+# Rows moved per write transaction, so requests waiting for the writer are
+# only held up briefly
+ARCHIVE_CHUNK_SIZE = 1000
+EPSILON = 1e-9
+
+predictions = Prediction.__table__
+archived_predictions = ArchivedPrediction.__table__
+
+
+def history(statement, archived=True):
+    """`statement(table)` on the live predictions, UNION ALL the archive when `archived`.
+
+    Both tables have the same columns, so callers build one statement and
+    get the other for free. ORDER BY and LIMIT go on the result, where SQLite
+    merges the two arms in index order.
+    """
+    if not archived:
+        return statement(predictions)
+    return union_all(statement(predictions), statement(archived_predictions))
+
+
+def _win_rank(trophy):
+    units, prediction_id, _ = trophy
+    return -units, prediction_id
+
+
+def _loss_rank(trophy):
+    units, prediction_id, _ = trophy
+    return units, prediction_id
+
+
+def best_win(a, b):
+    """The larger of two (units, prediction_id, description) wins, earliest bet first on ties."""
+    if a is None or b is None:
+        return a or b
+    return min(a, b, key=_win_rank)
+
+
+def worst_loss(a, b):
+    if a is None or b is None:
+        return a or b
+    return min(a, b, key=_loss_rank)
+
+
+def _empty_fold():
+    # wins, losses, net units, best win, worst loss
+    return [0, 0, 0.0, None, None]
+
+
+def fold(rows, totals=None):
+    """Add settled bets to per (user, category) wins, losses, net units and trophies."""
+    totals = totals if totals is not None else defaultdict(_empty_fold)
+    for row in rows:
+        if row.opponent_id is None:
+            continue
+        units = odds.creator_units(row.win_units, row.loss_units, row.outcome)
+        for user_id, user_units in ((row.creator_id, units), (row.opponent_id, -units)):
+            sums = totals[(user_id, row.category_id or 0)]
+            trophy = (user_units, row.id, row.description)
+            sums[2] += user_units
+            if user_units > 0:
+                sums[0] += 1
+                sums[3] = best_win(sums[3], trophy)
+            else:
+                sums[1] += 1
+                sums[4] = worst_loss(sums[4], trophy)
+    return totals
+
+
+def _trophy(units, prediction_id, description):
+    return None if prediction_id is None else (units, prediction_id, description)
+
+
+async def load_user_stats(db):
+    """The folded stats of every archived bet, keyed by (user_id, category_id)."""
+    result = await db.execute(select(ArchivedUserStats))
+    totals = defaultdict(_empty_fold)
+    for row in result.scalars():
+        totals[(row.user_id, row.category_id)] = [
+            row.wins,
+            row.losses,
+            row.net_units,
+            _trophy(row.best_win_units, row.best_win_prediction_id, row.best_win_description),
+            _trophy(
+                row.worst_loss_units, row.worst_loss_prediction_id, row.worst_loss_description
+            ),
+        ]
+    return totals
+
+
+async def _store_user_stats(db, totals):
+    # Small enough (users x categories) to rewrite whole
+    await db.execute(delete(ArchivedUserStats))
+    rows = []
+    for (user_id, category_id), (wins, losses, net_units, win, loss) in totals.items():
+        win = win or (None, None, None)
+        loss = loss or (None, None, None)
+        rows.append(
+            {
+                "user_id": user_id,
+                "category_id": category_id,
+                "wins": wins,
+                "losses": losses,
+                "net_units": net_units,
+                "best_win_units": win[0],
+                "best_win_prediction_id": win[1],
+                "best_win_description": win[2],
+                "worst_loss_units": loss[0],
+                "worst_loss_prediction_id": loss[1],
+                "worst_loss_description": loss[2],
+            }
+        )
+    if rows:
+        await db.execute(insert(ArchivedUserStats), rows)
+
+
+async def archive_redeemed():
+    """Move predictions redeemed more than ARCHIVE_AFTER_DAYS ago into the archive.
+
+    Each chunk is deleted from the live table, inserted into the archive and
+    folded into archived_user_stats in one transaction. The ledger,
+    calibration totals, rollups and search index already account for the
+    rows and stay as they are. Returns how many predictions were moved.
+    """
+    now = datetime.datetime.utcnow()
+    cutoff = now - datetime.timedelta(days=ARCHIVE_AFTER_DAYS)
+    # Bets settled before the timestamps existed fall back to an earlier one
+    settled_at = func.coalesce(
+        predictions.c.redeemed_at, predictions.c.resolved_at, predictions.c.created_at
+    )
+    chunk = (
+        select(predictions.c.id)
+        .where(predictions.c.status == "REDEEMED", settled_at < cutoff)
+        .order_by(predictions.c.id)
+        .limit(ARCHIVE_CHUNK_SIZE)
+        .scalar_subquery()
+    )
+    moved = 0
+    while True:
+        async with WriteSessionLocal() as session:
+            result = await session.execute(
+                delete(predictions)
+                .where(predictions.c.id.in_(chunk))
+                .returning(*predictions.c)
+            )
+            rows = result.all()
+            if not rows:
+                break
+            await session.execute(
+                insert(archived_predictions),
+                [{**row._mapping, "archived_at": now} for row in rows],
+            )
+            totals = fold(rows, await load_user_stats(session))
+            await _store_user_stats(session, totals)
+            await session.commit()
+        moved += len(rows)
+    return moved
+
+
+async def delete_user_predictions(db, user_id):
+    # Matches the cascade from User.predictions on the live table
+    await db.execute(
+        delete(archived_predictions).where(archived_predictions.c.creator_id == user_id)
+    )
+
+
+async def uncategorise(db, category_id):
+    # Matches what deleting a Category does to its live predictions
+    await db.execute(
+        update(archived_predictions)
+        .where(archived_predictions.c.category_id == category_id)
+        .values(category_id=None)
+    )
+
+
+async def compute_user_stats(db):
+    result = await db.stream(
+        select(
+            archived_predictions.c.id,
+            archived_predictions.c.description,
+            archived_predictions.c.creator_id,
+            archived_predictions.c.opponent_id,
+            archived_predictions.c.category_id,
+            archived_predictions.c.win_units,
+            archived_predictions.c.loss_units,
+            archived_predictions.c.outcome,
+        )
+    )
+    totals = None
+    async for partition in result.partitions(1000):
+        totals = fold(partition, totals)
+    return totals if totals is not None else {}
+
+
+def _differs(stored, expected):
+    wins, losses, net_units, win, loss = stored
+    return (
+        (wins, losses) != tuple(expected[:2])
+        or abs(net_units - expected[2]) > EPSILON
+        or (win and win[1]) != (expected[3] and expected[3][1])
+        or (loss and loss[1]) != (expected[4] and expected[4][1])
+    )
+
+
+async def verify_user_stats(db):
+    """Compare the folded stats with a full recomputation from the archive and return any drift."""
+    expected = await compute_user_stats(db)
+    stored = await load_user_stats(db)
+    drift = []
+    for key in sorted(set(expected) | set(stored)):
+        stored_sums = stored.get(key, _empty_fold())
+        expected_sums = expected.get(key, _empty_fold())
+        if _differs(stored_sums, expected_sums):
+            drift.append((key, stored_sums, expected_sums))
+    return drift
+
+
+async def rebuild_user_stats(db):
+    await _store_user_stats(db, await compute_user_stats(db))
@@ -0,0 +1,48 @@
+import functools
+import hashlib
+import os
+
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.staticfiles import StaticFiles
+
+STATIC_DIR = "static"
+TEMPLATES_DIR = "templates"
+# Browsers may keep a file for good when its URL names its contents
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Streamed responses; older Starlette versions buffer a gzipped body until
+# it ends, which an event stream never does
+UNCOMPRESSED_PATHS = {"/api/events", "/api/predictions/export"}
+
+
+@functools.lru_cache(maxsize=None)
+def asset_url(path):
+    """URL of a file under static/ with a content hash, or None if it is missing."""
+    try:
+        with open(os.path.join(STATIC_DIR, path), "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    except FileNotFoundError:
+        return None
+    return f"/static/{path}?v={digest}"
+
+
+class VersionedStaticFiles(StaticFiles):
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        # Unversioned URLs keep the default revalidation with ETag/Last-Modified
+        if scope["query_string"].startswith(b"v="):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+
+class CompressionMiddleware:
+    """GZip for every response except the streamed ones."""
+
+    def __init__(self, app):
+        self.app = app
+        self.gzip = GZipMiddleware(app)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in UNCOMPRESSED_PATHS:
+            await self.app(scope, receive, send)
+            return
+        await self.gzip(scope, receive, send)
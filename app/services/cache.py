@@ -0,0 +1,277 @@
+import asyncio
+import collections
+import hashlib
+import logging
+import os
+import sqlite3
+import urllib.parse
+
+from decouple import config
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.database.database import DATABASE_PATH
+from app.services import assets, events, metrics, reference
+
+logger = logging.getLogger("app.cache")
+
+RESPONSE_CACHE_MAX_BYTES = config("RESPONSE_CACHE_MAX_BYTES", default=16 * 1024 * 1024, cast=int)
+# A single huge listing should not flush everything else out of the cache
+MAX_CACHED_RESPONSE_BYTES = RESPONSE_CACHE_MAX_BYTES // 4
+# How often idle processes look for other processes' writes to tell their
+# event stream clients; requests always check first
+WRITE_POLL_SECONDS = config("WRITE_POLL_SECONDS", default=1.0, cast=float)
+
+# Read endpoints and pages whose body depends only on the URL and the
+# database contents
+CACHED_PATHS = {
+    "/",
+    "/new",
+    "/history",
+    "/stats",
+    "/api/predictions",
+    "/api/predictions/search",
+    "/api/stats",
+    "/api/user-stats",
+    "/api/calibration",
+    "/api/balance-history",
+    "/api/simulate",
+    "/api/users",
+    "/api/categories",
+}
+
+
+def _code_version():
+    # The same data renders differently after an upgrade, so ETags also name
+    # the deployed code. Only the code and the files pages are built from are
+    # hashed, by content and by path within their directory: in the image the
+    # package directory also holds the mounted data/, which changes with every
+    # write and backup and would give each worker its own value
+    digest = hashlib.sha256()
+    package = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for directory, wanted in (
+        (package, lambda filename: filename.endswith(".py")),
+        (os.path.abspath(assets.TEMPLATES_DIR), lambda filename: True),
+        (os.path.abspath(assets.STATIC_DIR), lambda filename: True),
+    ):
+        for dirpath, dirnames, filenames in os.walk(directory):
+            dirnames[:] = sorted(name for name in dirnames if name != "__pycache__")
+            for filename in sorted(filter(wanted, filenames)):
+                path = os.path.join(dirpath, filename)
+                with open(path, "rb") as f:
+                    digest.update(os.path.relpath(path, directory).encode() + b"\0")
+                    digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()[:8]
+
+
+_CODE_VERSION = _code_version()
+
+
+class DataVersion:
+    """The database's write counter as last seen by this process.
+
+    Our own commits report their new count; other processes' commits are
+    noticed by reading the counter, which also drops the reference caches
+    and tells event stream clients to resync.
+    """
+
+    def __init__(self, database):
+        self.value = None
+        self._database = database
+        self._connection = None
+
+    def etag(self, value):
+        return f'"{_CODE_VERSION}-{value}"'
+
+    def _read(self):
+        # A plain blocking read: one row from a hot page takes microseconds,
+        # less than handing the query to a driver thread would
+        if self._connection is None:
+            self._connection = sqlite3.connect(
+                f"file:{urllib.parse.quote(self._database)}?mode=ro",
+                uri=True,
+                timeout=0.1,
+                check_same_thread=False,
+            )
+        return self._connection.execute("SELECT writes FROM write_counter").fetchone()[0]
+
+    def _invalidate(self):
+        reference.users.invalidate()
+        reference.categories.invalidate()
+        events.bus.publish("resync", {})
+
+    def check(self):
+        try:
+            writes = self._read()
+        except sqlite3.Error:
+            # Cannot tell what changed, so assume everything did
+            logger.exception("Could not read the write counter")
+            self._connection = None
+            responses.clear()
+            self._invalidate()
+            return
+        if writes != self.value:
+            self.value = writes
+            self._invalidate()
+
+    def after_commit(self, session):
+        # Recorded only once the commit has reached the database: a reader that
+        # still saw the old version can at worst cache a response nobody asks
+        # for again, never pin stale data to the new version
+        writes = session.info.pop("writes", None)
+        if writes is None:
+            return
+        if self.value is not None and writes != self.value + 1:
+            # Another process committed in between
+            self._invalidate()
+        self.value = writes
+
+
+data_version = DataVersion(DATABASE_PATH)
+event.listen(Session, "after_commit", data_version.after_commit)
+
+
+async def watch_writes():
+    """Keep checking for other processes' writes while clients are listening for events."""
+    while True:
+        await asyncio.sleep(WRITE_POLL_SECONDS)
+        if events.bus.has_subscribers:
+            data_version.check()
+
+
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return etag in tags or "*" in tags
+
+
+CachedResponse = collections.namedtuple("CachedResponse", "version status headers body")
+
+
+class ResponseCache:
+    """Encoded responses keyed by path and query, evicted least recently used first."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = collections.OrderedDict()
+
+    def get(self, key, version):
+        entry = self._entries.get(key)
+        if entry is None or entry.version != version:
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous.body)
+        self._entries[key] = entry
+        self.size += len(entry.body)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted.body)
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+
+responses = ResponseCache(RESPONSE_CACHE_MAX_BYTES)
+
+
+def _response_headers(headers, etag):
+    return [
+        (name, value) for name, value in headers if name not in (b"etag", b"cache-control")
+    ] + [(b"etag", etag.encode()), (b"cache-control", b"no-cache")]
+
+
+class ResponseCacheMiddleware:
+    """Answers conditional and repeated GETs of read endpoints without running them.
+
+    Also brings this process's caches up to date with writes made by other
+    processes before each request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        # Matched route per path, so the metrics middleware can still label
+        # requests answered before the router runs
+        self._routes = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith("/static/"):
+            await self.app(scope, receive, send)
+            return
+        # Every request sees other processes' writes, including through the
+        # reference caches of endpoints that are not cached here
+        data_version.check()
+        if scope["method"] != "GET" or scope["path"] not in CACHED_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        version = data_version.value
+        etag = data_version.etag(version)
+        if_none_match = None
+        for name, value in scope["headers"]:
+            if name == b"if-none-match":
+                if_none_match = value.decode("latin-1")
+        key = (scope["path"], scope["query_string"])
+        entry = responses.get(key, version)
+        if scope["path"] in self._routes:
+            scope["route"] = self._routes[scope["path"]]
+
+        if _etag_matches(if_none_match, etag):
+            metrics.response_cache.inc(result="not_modified")
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 304,
+                    "headers": [(b"etag", etag.encode()), (b"cache-control", b"no-cache")],
+                }
+            )
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if entry is not None:
+            metrics.response_cache.inc(result="hit")
+            await send(
+                {"type": "http.response.start", "status": entry.status, "headers": list(entry.headers)}
+            )
+            await send({"type": "http.response.body", "body": entry.body})
+            return
+
+        metrics.response_cache.inc(result="miss")
+        status = headers = None
+        chunks = []
+        size = 0
+        cacheable = True
+
+        async def send_and_capture(message):
+            nonlocal status, headers, size, cacheable
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if status == 200:
+                    headers = _response_headers(message.get("headers", []), etag)
+                    # Outer middleware such as GZip edits the header list in place
+                    message = {**message, "headers": list(headers)}
+                else:
+                    cacheable = False
+            elif message["type"] == "http.response.body" and cacheable:
+                chunks.append(message.get("body", b""))
+                size += len(chunks[-1])
+                if size > MAX_CACHED_RESPONSE_BYTES:
+                    cacheable = False
+                    chunks.clear()
+                elif not message.get("more_body", False):
+                    responses.put(
+                        key,
+                        CachedResponse(version, status, headers, b"".join(chunks)),
+                    )
+            await send(message)
+
+        await self.app(scope, receive, send_and_capture)
+        if scope.get("route") is not None:
+            self._routes[scope["path"]] = scope["route"]
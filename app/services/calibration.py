@@ -0,0 +1,218 @@
+import math
+from collections import defaultdict
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert
+
+from app.models.models import CalibrationBucket
+from app.services import archive, reference
+from app.services.stats import SETTLED_STATUSES
+
+# Reliability curve resolution: confidences are grouped into tenths
+BUCKETS = 10
+# Keeps the log loss finite for legacy rows stored at 0% or 100% confidence
+LOG_LOSS_CLIP = 1e-15
+# Running sums that should be zero can be left with floating point residue
+EPSILON = 1e-9
+
+FIELDS = ("count", "confidence_sum", "hits", "brier_sum", "log_loss_sum")
+
+
+def bucket_for(confidence):
+    return min(int(confidence * BUCKETS), BUCKETS - 1)
+
+
+def calibration_entry(prediction):
+    """Return the (key, deltas) a decided prediction adds to the accumulators."""
+    if prediction.status not in SETTLED_STATUSES or prediction.outcome is None:
+        return None
+    confidence = prediction.confidence
+    happened = 1 if prediction.outcome else 0
+    clipped = min(max(confidence, LOG_LOSS_CLIP), 1 - LOG_LOSS_CLIP)
+    key = (prediction.creator_id, prediction.category_id or 0, bucket_for(confidence))
+    deltas = (
+        1,
+        confidence,
+        happened,
+        (confidence - happened) ** 2,
+        -math.log(clipped if happened else 1 - clipped),
+    )
+    return key, deltas
+
+
+def accumulate(predictions, sign=1, totals=None):
+    """Sum the calibration entries of `predictions` per (user, category, bucket)."""
+    totals = totals if totals is not None else defaultdict(lambda: [0, 0.0, 0, 0.0, 0.0])
+    for prediction in predictions:
+        entry = calibration_entry(prediction)
+        if entry is None:
+            continue
+        key, deltas = entry
+        sums = totals[key]
+        for i, delta in enumerate(deltas):
+            sums[i] += sign * delta
+    return totals
+
+
+async def post_entries(db, predictions, sign=1):
+    # Upsert one row per affected bucket inside the caller's transaction
+    for (user_id, category_id, bucket), sums in accumulate(predictions, sign).items():
+        stmt = insert(CalibrationBucket).values(
+            user_id=user_id,
+            category_id=category_id,
+            bucket=bucket,
+            **dict(zip(FIELDS, sums)),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[
+                CalibrationBucket.user_id,
+                CalibrationBucket.category_id,
+                CalibrationBucket.bucket,
+            ],
+            set_={
+                field: getattr(CalibrationBucket, field) + getattr(stmt.excluded, field)
+                for field in FIELDS
+            },
+        )
+        await db.execute(stmt)
+
+
+def _summary(sums):
+    count, confidence_sum, hits, brier_sum, log_loss_sum = sums
+    return {
+        "count": count,
+        "brier_score": brier_sum / count,
+        "log_loss": log_loss_sum / count,
+        "mean_confidence": confidence_sum / count,
+        "hit_rate": hits / count,
+    }
+
+
+def _add(target, sums):
+    for i, value in enumerate(sums):
+        target[i] += value
+
+
+class _Group:
+    __slots__ = ("sums", "buckets")
+
+    def __init__(self):
+        self.sums = [0, 0.0, 0, 0.0, 0.0]
+        self.buckets = defaultdict(lambda: [0, 0.0, 0, 0.0, 0.0])
+
+    def add(self, bucket, sums):
+        _add(self.sums, sums)
+        _add(self.buckets[bucket], sums)
+
+    def report(self):
+        report = _summary(self.sums)
+        report["buckets"] = [
+            {
+                "bucket": bucket,
+                "lower": bucket / BUCKETS,
+                "upper": (bucket + 1) / BUCKETS,
+                "count": sums[0],
+                "mean_confidence": sums[1] / sums[0],
+                "observed_rate": sums[2] / sums[0],
+            }
+            for bucket, sums in sorted(self.buckets.items())
+        ]
+        return report
+
+
+async def get_calibration(db):
+    """Brier score, log loss and reliability buckets overall, per user and per category."""
+    user_names = await reference.users.load(db)
+    category_names = await reference.categories.load(db)
+    result = await db.execute(
+        select(
+            CalibrationBucket.user_id,
+            CalibrationBucket.category_id,
+            CalibrationBucket.bucket,
+            *(getattr(CalibrationBucket, field) for field in FIELDS),
+        ).where(CalibrationBucket.count > 0)
+    )
+    overall = _Group()
+    users = defaultdict(_Group)
+    categories = defaultdict(_Group)
+    for user_id, category_id, bucket, *sums in result.all():
+        overall.add(bucket, sums)
+        users[user_id].add(bucket, sums)
+        categories[category_id].add(bucket, sums)
+    return {
+        "overall": overall.report() if overall.sums[0] else None,
+        "users": [
+            {"id": user_id, "name": user_names.get(user_id, "Unknown"), **group.report()}
+            for user_id, group in sorted(users.items())
+        ],
+        "categories": [
+            {
+                "id": category_id,
+                "name": category_names.get(category_id, "Unknown"),
+                **group.report(),
+            }
+            for category_id, group in sorted(categories.items())
+        ],
+    }
+
+
+def _decided(table):
+    return select(
+        table.c.status,
+        table.c.creator_id,
+        table.c.category_id,
+        table.c.confidence,
+        table.c.outcome,
+    ).where(table.c.status.in_(SETTLED_STATUSES))
+
+
+async def compute_accumulators(db):
+    # Archived bets were counted before they were moved and still are
+    result = await db.stream(archive.history(_decided))
+    totals = None
+    async for partition in result.partitions(1000):
+        totals = accumulate(partition, totals=totals)
+    return totals if totals is not None else {}
+
+
+async def verify_calibration(db):
+    """Compare the stored accumulators with a full recomputation and return any drift."""
+    expected = await compute_accumulators(db)
+    result = await db.execute(
+        select(
+            CalibrationBucket.user_id,
+            CalibrationBucket.category_id,
+            CalibrationBucket.bucket,
+            *(getattr(CalibrationBucket, field) for field in FIELDS),
+        )
+    )
+    stored = {
+        (user_id, category_id, bucket): sums
+        for user_id, category_id, bucket, *sums in result.all()
+    }
+    empty = [0] * len(FIELDS)
+    drift = []
+    for key in sorted(set(expected) | set(stored)):
+        stored_sums = stored.get(key, empty)
+        expected_sums = expected.get(key, empty)
+        if any(abs(a - b) > EPSILON for a, b in zip(stored_sums, expected_sums)):
+            drift.append((key, list(stored_sums), list(expected_sums)))
+    return drift
+
+
+async def rebuild_calibration(db):
+    expected = await compute_accumulators(db)
+    await db.execute(delete(CalibrationBucket))
+    if expected:
+        await db.execute(
+            insert(CalibrationBucket),
+            [
+                {
+                    "user_id": user_id,
+                    "category_id": category_id,
+                    "bucket": bucket,
+                    **dict(zip(FIELDS, sums)),
+                }
+                for (user_id, category_id, bucket), sums in expected.items()
+            ],
+        )
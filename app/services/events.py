@@ -0,0 +1,37 @@
+import asyncio
+
+# Each connected client gets its own bounded queue; a client that falls this
+# far behind is told to resync instead of slowing down publishers
+MAX_PENDING_EVENTS = 100
+
+
+class EventBus:
+    """In-process fan-out of small change events to connected clients."""
+
+    def __init__(self):
+        self._subscribers = set()
+
+    @property
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=MAX_PENDING_EVENTS)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, event_type, data):
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait((event_type, data))
+            except asyncio.QueueFull:
+                # Drop the backlog; the client refetches everything on "resync"
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(("resync", {}))
+
+
+bus = EventBus()
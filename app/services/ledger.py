@@ -0,0 +1,117 @@
+from collections import defaultdict
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert
+
+from app.models.models import Balance, Prediction
+from app.services import odds, reference
+
+# Balances below this are floating point residue left over after a debt has
+# been added and then paid off again.
+EPSILON = 1e-9
+
+
+def ledger_entry(prediction):
+    """Return the (debtor_id, creditor_id, amount) a prediction contributes to the ledger."""
+    # Only settled-but-unpaid bets with an opponent count towards debts
+    if prediction.status != "RESOLVED":
+        return None
+    return settlement_entry(prediction)
+
+
+def settlement_entry(prediction):
+    """Return who owes whom how much for a decided bet, regardless of its status."""
+    if prediction.opponent_id is None:
+        return None
+    units = odds.creator_units(prediction.win_units, prediction.loss_units, prediction.outcome)
+    if units > 0:  # Creator wins
+        return (prediction.opponent_id, prediction.creator_id, units)
+    return (prediction.creator_id, prediction.opponent_id, -units)
+
+
+def _totals(entries, sign=1.0):
+    totals = defaultdict(float)
+    for entry in entries:
+        if entry is None:
+            continue
+        debtor_id, creditor_id, amount = entry
+        totals[(debtor_id, creditor_id)] += sign * amount
+    return totals
+
+
+async def post_entries(db, entries, sign=1.0):
+    # Upsert one row per (debtor, creditor) pair inside the caller's transaction
+    for (debtor_id, creditor_id), amount in _totals(entries, sign).items():
+        if amount == 0:
+            continue
+        stmt = insert(Balance).values(
+            debtor_id=debtor_id, creditor_id=creditor_id, amount=amount
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Balance.debtor_id, Balance.creditor_id],
+            set_={"amount": Balance.amount + stmt.excluded.amount},
+        )
+        await db.execute(stmt)
+
+
+async def get_balances(db):
+    user_names = await reference.users.load(db)
+    result = await db.execute(
+        select(Balance.debtor_id, Balance.creditor_id, Balance.amount).where(
+            Balance.amount > EPSILON
+        )
+    )
+    return [
+        {
+            "debtor": user_names.get(debtor_id, "Unknown"),
+            "creditor": user_names.get(creditor_id, "Unknown"),
+            "amount": round(amount, 2),
+        }
+        for debtor_id, creditor_id, amount in result.all()
+    ]
+
+
+async def compute_balances(db):
+    result = await db.stream(
+        select(
+            Prediction.status,
+            Prediction.creator_id,
+            Prediction.opponent_id,
+            Prediction.win_units,
+            Prediction.loss_units,
+            Prediction.outcome,
+        ).where(Prediction.status == "RESOLVED")
+    )
+    totals = defaultdict(float)
+    async for row in result:
+        entry = ledger_entry(row)
+        if entry is not None:
+            totals[(entry[0], entry[1])] += entry[2]
+    return totals
+
+
+async def verify_ledger(db):
+    """Compare the stored ledger with a full recomputation and return any drift."""
+    expected = await compute_balances(db)
+    result = await db.execute(
+        select(Balance.debtor_id, Balance.creditor_id, Balance.amount)
+    )
+    stored = {(debtor_id, creditor_id): amount for debtor_id, creditor_id, amount in result.all()}
+    drift = []
+    for pair in sorted(set(expected) | set(stored)):
+        if abs(stored.get(pair, 0.0) - expected.get(pair, 0.0)) > EPSILON:
+            drift.append((pair[0], pair[1], stored.get(pair, 0.0), expected.get(pair, 0.0)))
+    return drift
+
+
+async def rebuild_ledger(db):
+    expected = await compute_balances(db)
+    await db.execute(delete(Balance))
+    if expected:
+        await db.execute(
+            insert(Balance),
+            [
+                {"debtor_id": debtor_id, "creditor_id": creditor_id, "amount": amount}
+                for (debtor_id, creditor_id), amount in expected.items()
+            ],
+        )
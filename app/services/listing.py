@@ -0,0 +1,156 @@
+import base64
+import datetime
+import json
+from typing import List, Optional
+
+from pydantic import BaseModel
+from sqlalchemy import false, or_, select, tuple_
+
+from app.services import archive, reference, search
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# Every prediction column, for listings that load full Prediction objects
+FIELDS = tuple(column.key for column in archive.predictions.c)
+# Columns returned by the compact listing formats, in row order
+COMPACT_FIELDS = (
+    "id",
+    "description",
+    "creator_id",
+    "opponent_id",
+    "category_id",
+    "confidence",
+    "win_units",
+    "loss_units",
+    "status",
+    "outcome",
+    "created_at",
+)
+
+
+class PredictionFilters(BaseModel):
+    status: Optional[List[str]] = None
+    category_id: Optional[int] = None
+    creator_id: Optional[int] = None
+    opponent_id: Optional[int] = None
+    # Matches bets where the user is either the creator or the opponent
+    user_id: Optional[int] = None
+    created_after: Optional[datetime.datetime] = None
+    created_before: Optional[datetime.datetime] = None
+    q: Optional[str] = None
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, prediction_id):
+    payload = json.dumps([created_at.isoformat(), prediction_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, prediction_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.datetime.fromisoformat(created_at), int(prediction_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+def includes_archive(filters):
+    # Only redeemed bets are archived, so the dashboard's listings of the
+    # other statuses never touch the archive
+    return not filters.status or "REDEEMED" in filters.status
+
+
+def columns(table, names):
+    return [table.c[name] for name in names]
+
+
+def apply_filters(stmt, filters, table=archive.predictions):
+    """Narrow a statement on the live or the archived predictions table to the filters."""
+    if filters.status:
+        stmt = stmt.where(table.c.status.in_(filters.status))
+    if filters.category_id is not None:
+        stmt = stmt.where(table.c.category_id == filters.category_id)
+    if filters.creator_id is not None:
+        stmt = stmt.where(table.c.creator_id == filters.creator_id)
+    if filters.opponent_id is not None:
+        stmt = stmt.where(table.c.opponent_id == filters.opponent_id)
+    if filters.user_id is not None:
+        stmt = stmt.where(
+            or_(
+                table.c.creator_id == filters.user_id,
+                table.c.opponent_id == filters.user_id,
+            )
+        )
+    if filters.created_after is not None:
+        stmt = stmt.where(table.c.created_at >= filters.created_after)
+    if filters.created_before is not None:
+        stmt = stmt.where(table.c.created_at < filters.created_before)
+    if filters.q:
+        # Word-prefix search through the full-text index
+        query = search.match_query(filters.q)
+        if query is None:
+            return stmt.where(false())
+        stmt = stmt.where(search.matches(query, table.c.id))
+    return stmt
+
+
+def matching(names, filters, before=None):
+    """Select the named columns of every matching prediction, archived ones included if needed.
+
+    `before` is a (created_at, id) keyset position; it goes into each arm of
+    the archive union so both tables seek straight to it through their indexes.
+    """
+
+    def statement(table):
+        stmt = apply_filters(select(*columns(table, names)), filters, table)
+        if before is not None:
+            stmt = stmt.where(tuple_(table.c.created_at, table.c.id) < tuple_(*before))
+        return stmt
+
+    return archive.history(statement, includes_archive(filters))
+
+
+def page(names, filters, cursor, limit):
+    # Keyset pagination, newest first; fetch one extra row to detect a next
+    # page. A limit of None selects every remaining row
+    before = decode_cursor(cursor) if cursor is not None else None
+    stmt = matching(names, filters, before)
+    selected = stmt.selected_columns
+    stmt = stmt.order_by(selected.created_at.desc(), selected.id.desc())
+    return stmt if limit is None else stmt.limit(limit + 1)
+
+
+def split_page(rows, limit):
+    """Trim the look-ahead row from a page and return (rows, next_cursor)."""
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last.created_at, last.id)
+
+
+async def compact_payload(db, rows, columnar=False, extra_columns=()):
+    """Build a compact listing: bare rows plus one lookup table of user and category names."""
+    user_names = await reference.users.load(db)
+    category_names = await reference.categories.load(db)
+    user_ids = {row.creator_id for row in rows} | {
+        row.opponent_id for row in rows if row.opponent_id is not None
+    }
+    users = {str(user_id): user_names.get(user_id, "Unknown") for user_id in user_ids}
+    categories = {
+        str(category_id): category_names.get(category_id, "Unknown")
+        for category_id in {row.category_id for row in rows if row.category_id is not None}
+    }
+
+    names = list(COMPACT_FIELDS) + list(extra_columns)
+    payload = {"columns": names, "users": users, "categories": categories}
+    if columnar:
+        payload["data"] = {name: [row[i] for row in rows] for i, name in enumerate(names)}
+    else:
+        payload["rows"] = [tuple(row) for row in rows]
+    return payload
@@ -0,0 +1,242 @@
+import bisect
+import contextvars
+import logging
+import time
+
+from decouple import config
+from sqlalchemy import event
+
+logger = logging.getLogger("app.sql")
+
+SLOW_QUERY_MS = config("SLOW_QUERY_MS", default=100, cast=float)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+JOB_BUCKETS = (0.01, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Long-lived streams and the scrape itself would only skew the histograms
+UNTIMED_PATHS = {"/metrics", "/api/events"}
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(
+                    f"{self.name}_bucket{_labels(key + (('le', _number(bound)),))} {cumulative}"
+                )
+            lines.append(f"{self.name}_bucket{_labels(key + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{_labels(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(key)} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._series = {}
+
+    def inc(self, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        self._series[key] = self._series.get(key, 0) + value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._series.items()):
+            lines.append(f"{self.name}{_labels(key)} {_number(value)}")
+        return lines
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in key) + "}"
+
+
+request_duration = Histogram(
+    "http_request_duration_seconds", "Time spent handling a request.", LATENCY_BUCKETS
+)
+response_size = Histogram(
+    "http_response_size_bytes", "Size of the response body.", SIZE_BUCKETS
+)
+request_queries = Histogram(
+    "db_queries_per_request", "SQL statements executed per request.", QUERY_COUNT_BUCKETS
+)
+query_duration = Histogram(
+    "db_query_duration_seconds", "Time spent executing single SQL statements.", LATENCY_BUCKETS
+)
+rows_loaded = Counter(
+    "db_rows_loaded_total", "Rows returned by SQL statements, except streamed results."
+)
+slow_queries = Counter(
+    "db_slow_queries_total", f"SQL statements slower than {SLOW_QUERY_MS:g} ms."
+)
+response_cache = Counter(
+    "http_response_cache_total", "Cacheable GET requests by how they were answered."
+)
+job_duration = Histogram(
+    "scheduler_job_duration_seconds", "Time spent running maintenance jobs.", JOB_BUCKETS
+)
+job_runs = Counter("scheduler_job_runs_total", "Maintenance job runs by outcome.")
+
+REGISTRY = [
+    request_duration,
+    response_size,
+    request_queries,
+    query_duration,
+    rows_loaded,
+    slow_queries,
+    response_cache,
+    job_duration,
+    job_runs,
+]
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class RequestStats:
+    __slots__ = ("scope", "queries", "query_seconds", "rows")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.rows = 0
+
+    @property
+    def route(self):
+        # The router stores the matched route in the scope; labelling by its
+        # template rather than the raw path keeps the number of series bounded
+        route = self.scope.get("route")
+        if route is not None:
+            return route.path
+        if self.scope["path"].startswith("/static/"):
+            return "/static"
+        return "unmatched"
+
+
+_current = contextvars.ContextVar("request_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _rows_returned(cursor):
+    # Most reads are Core rows and RETURNING clauses rather than ORM objects,
+    # so rows are counted at the cursor. The aiosqlite adapter fetches a
+    # whole result while the statement runs; server-side cursors, used for
+    # streaming, fetch later and are left out
+    if cursor.description is None:
+        return 0
+    rows = getattr(cursor, "_rows", None)
+    return len(rows) if rows is not None else 0
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    stats = _current.get()
+    route = stats.route if stats is not None else "background"
+    if stats is not None:
+        stats.queries += 1
+        stats.query_seconds += elapsed
+        stats.rows += _rows_returned(cursor)
+    query_duration.observe(elapsed, route=route)
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        slow_queries.inc(route=route)
+        logger.warning(
+            "Slow query (%.1f ms) in %s: %s", elapsed * 1000, route, " ".join(statement.split())
+        )
+
+
+def instrument_engine(engine):
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _server_timing(stats, elapsed):
+    app_seconds = max(elapsed - stats.query_seconds, 0.0)
+    return (
+        f'db;dur={stats.query_seconds * 1000:.1f};desc="{stats.queries} queries", '
+        f"app;dur={app_seconds * 1000:.1f}, "
+        f"total;dur={elapsed * 1000:.1f}"
+    ).encode()
+
+
+class MetricsMiddleware:
+    """Records per-route latency, SQL and response size metrics."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in UNTIMED_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status = 500
+        body_bytes = 0
+
+        async def send_with_metrics(message):
+            nonlocal status, body_bytes
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append(
+                    (b"server-timing", _server_timing(stats, time.perf_counter() - started))
+                )
+                message = {**message, "headers": headers}
+            elif message["type"] == "http.response.body":
+                body_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            _current.reset(token)
+            elapsed = time.perf_counter() - started
+            route = stats.route
+            labels = {"method": scope["method"], "route": route, "status": str(status)}
+            request_duration.observe(elapsed, **labels)
+            response_size.observe(body_bytes, **labels)
+            request_queries.observe(stats.queries, method=scope["method"], route=route)
+            if stats.rows:
+                rows_loaded.inc(stats.rows, route=route)
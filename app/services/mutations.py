@@ -0,0 +1,74 @@
+from sqlalchemy import delete, insert, select, update
+
+from app.models.models import Prediction
+from app.services import archive, odds, reference
+
+# Writes go through Core statements on the table with RETURNING, so each
+# mutation is a single statement and never populates the identity map
+predictions = Prediction.__table__
+
+
+async def insert_prediction(db, values):
+    values = {**values, **odds.payout_columns(values["confidence"])}
+    result = await db.execute(
+        insert(predictions).values(**values).returning(*predictions.c)
+    )
+    return result.one()
+
+
+async def update_prediction(db, prediction_id, values, *conditions):
+    """Apply `values` only if every condition still holds and return the updated row, or None."""
+    result = await db.execute(
+        update(predictions)
+        .where(predictions.c.id == prediction_id, *conditions)
+        .values(**values)
+        .returning(*predictions.c)
+    )
+    return result.first()
+
+
+async def update_predictions(db, values, *conditions):
+    """Apply `values` to every row matching the conditions in one statement and return them."""
+    result = await db.execute(
+        update(predictions).where(*conditions).values(**values).returning(*predictions.c)
+    )
+    return result.all()
+
+
+async def delete_prediction(db, prediction_id):
+    result = await db.execute(
+        delete(predictions)
+        .where(predictions.c.id == prediction_id)
+        .returning(*predictions.c)
+    )
+    return result.first()
+
+
+async def current_state(db, prediction_id):
+    # Only needed to explain why a conditional update matched no row; archived
+    # bets are found too, so they get the same answer as redeemed ones
+    def statement(table):
+        return select(table.c.status, table.c.creator_id).where(table.c.id == prediction_id)
+
+    result = await db.execute(archive.history(statement))
+    return result.first()
+
+
+async def prediction_out(db, row):
+    """Build a PredictionOut-shaped dict from a RETURNING row and the cached names."""
+    user_names = await reference.users.load(db)
+    category_names = await reference.categories.load(db)
+    return {
+        **row._mapping,
+        "creator": {"id": row.creator_id, "name": user_names.get(row.creator_id, "Unknown")},
+        "opponent": (
+            {"id": row.opponent_id, "name": user_names.get(row.opponent_id, "Unknown")}
+            if row.opponent_id is not None
+            else None
+        ),
+        "category": (
+            {"id": row.category_id, "name": category_names.get(row.category_id, "Unknown")}
+            if row.category_id is not None
+            else None
+        ),
+    }
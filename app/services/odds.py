@@ -0,0 +1,40 @@
+import numpy as np
+
+# A bet's creator names a confidence that the event happens. At 50% or more
+# they risk confidence / (1 - confidence) units to win 1, below 50% they
+# risk 1 unit to win (1 - confidence) / confidence.
+
+
+def payouts(confidence):
+    """Return (win_units, loss_units) for the creator of a bet at this confidence."""
+    if confidence >= 0.5:
+        return 1.0, confidence / (1 - confidence)
+    return (1 - confidence) / confidence, 1.0
+
+
+def payout_columns(confidence):
+    # Stored on every prediction when it is written
+    win_units, loss_units = payouts(confidence)
+    return {"win_units": win_units, "loss_units": loss_units}
+
+
+def creator_units(win_units, loss_units, outcome):
+    """Units the creator gained (positive) or lost (negative) on a decided bet."""
+    return win_units if outcome else -loss_units
+
+
+def payouts_array(confidences):
+    """Vectorized payouts(): return (win_units, loss_units) arrays."""
+    confidences = np.asarray(confidences, dtype=float)
+    favourite = confidences >= 0.5
+    # np.where evaluates both branches, so keep the unused one finite
+    with np.errstate(divide="ignore", invalid="ignore"):
+        win_units = np.where(favourite, 1.0, (1 - confidences) / confidences)
+        loss_units = np.where(favourite, confidences / (1 - confidences), 1.0)
+    return win_units, loss_units
+
+
+def units_array(confidences, outcomes):
+    """Vectorized creator_units() straight from confidences and outcomes."""
+    win_units, loss_units = payouts_array(confidences)
+    return np.where(np.asarray(outcomes, dtype=bool), win_units, -loss_units)
@@ -0,0 +1,58 @@
+import asyncio
+import urllib.parse
+
+import orjson
+from markupsafe import Markup
+
+
+async def _get(app, url):
+    # Runs the API route in-process through the full middleware stack, so a
+    # rendered page shares the response cache with the endpoints it embeds
+    path, _, query = url.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": [],
+        "client": None,
+        "server": None,
+    }
+    status = None
+    body = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            body.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return b"".join(body) if status == 200 else None
+
+
+def api_url(path, params):
+    return f"{path}?{urllib.parse.urlencode(params)}" if params else path
+
+
+async def initial_data(app, urls):
+    """JSON object of API responses by URL, safe to inline in a <script> element.
+
+    The page scripts read it through getJSON() in layout.html instead of
+    fetching those URLs on first load; failed requests are left out so the
+    browser simply fetches them itself.
+    """
+    bodies = await asyncio.gather(*(_get(app, url) for url in urls))
+    members = [orjson.dumps(url) + b":" + body for url, body in zip(urls, bodies) if body]
+    # "<" is escaped so descriptions cannot close the script element early
+    data = (b"{" + b",".join(members) + b"}").replace(b"<", b"\\u003c")
+    return Markup(data.decode())
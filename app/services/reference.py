@@ -0,0 +1,40 @@
+import asyncio
+
+from sqlalchemy import select
+
+from app.models.models import Category, User
+
+class ReferenceTable:
+    """In-memory id -> name map of a small, rarely changing table."""
+
+    def __init__(self, model):
+        self.model = model
+        self.version = 0
+        self._rows = None
+        self._lock = asyncio.Lock()
+
+    async def load(self, db):
+        rows = self._rows
+        if rows is not None:
+            return rows
+        async with self._lock:
+            rows = self._rows
+            if rows is None:
+                version = self.version
+                result = await db.execute(
+                    select(self.model.id, self.model.name).order_by(self.model.id)
+                )
+                rows = dict(result.all())
+                # Only keep the snapshot if no write was committed meanwhile
+                if version == self.version:
+                    self._rows = rows
+        return rows
+
+    def invalidate(self):
+        # Called after a committed write to the table
+        self._rows = None
+        self.version += 1
+
+
+users = ReferenceTable(User)
+categories = ReferenceTable(Category)
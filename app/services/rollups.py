@@ -0,0 +1,262 @@
+from collections import defaultdict
+
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.dialects.sqlite import insert
+
+from app.models.models import DailyRollup
+from app.services import archive, ledger, reference
+from app.services.stats import SETTLED_STATUSES
+
+GRANULARITIES = ("day", "week", "month")
+EPSILON = 1e-9
+
+FIELDS = ("resolved_count", "won_units", "paid_units")
+
+
+def _pair_units(prediction):
+    # Who won how much, as (user_a, user_b, units won by user_a)
+    entry = ledger.settlement_entry(prediction)
+    if entry is None:
+        return None
+    debtor_id, creditor_id, amount = entry
+    if creditor_id < debtor_id:
+        return creditor_id, debtor_id, amount
+    return debtor_id, creditor_id, -amount
+
+
+def _key(timestamp, prediction, user_a_id, user_b_id):
+    return (timestamp.date(), user_a_id, user_b_id, prediction.category_id or 0)
+
+
+def resolve_entry(prediction):
+    """Return the (key, deltas) that resolving a prediction added to the rollups."""
+    if prediction.status not in SETTLED_STATUSES:
+        return None
+    pair = _pair_units(prediction)
+    if pair is None:
+        return None
+    user_a_id, user_b_id, units = pair
+    # Bets settled before the timestamps existed fall back to an earlier one
+    resolved_at = prediction.resolved_at or prediction.created_at
+    return _key(resolved_at, prediction, user_a_id, user_b_id), (1, units, 0.0)
+
+
+def redeem_entry(prediction):
+    """Return the (key, deltas) that redeeming a prediction added to the rollups."""
+    if prediction.status != "REDEEMED":
+        return None
+    pair = _pair_units(prediction)
+    if pair is None:
+        return None
+    user_a_id, user_b_id, units = pair
+    redeemed_at = prediction.redeemed_at or prediction.resolved_at or prediction.created_at
+    return _key(redeemed_at, prediction, user_a_id, user_b_id), (0, 0.0, units)
+
+
+def rollup_entries(prediction):
+    """Every contribution a prediction has made so far, e.g. to undo on delete."""
+    return [resolve_entry(prediction), redeem_entry(prediction)]
+
+
+def accumulate(entries, sign=1, totals=None):
+    totals = totals if totals is not None else defaultdict(lambda: [0, 0.0, 0.0])
+    for entry in entries:
+        if entry is None:
+            continue
+        key, deltas = entry
+        sums = totals[key]
+        for i, delta in enumerate(deltas):
+            sums[i] += sign * delta
+    return totals
+
+
+async def post_entries(db, entries, sign=1):
+    # Upsert one row per affected (day, pair, category) inside the caller's transaction
+    for (day, user_a_id, user_b_id, category_id), sums in accumulate(entries, sign).items():
+        stmt = insert(DailyRollup).values(
+            day=day,
+            user_a_id=user_a_id,
+            user_b_id=user_b_id,
+            category_id=category_id,
+            **dict(zip(FIELDS, sums)),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[
+                DailyRollup.day,
+                DailyRollup.user_a_id,
+                DailyRollup.user_b_id,
+                DailyRollup.category_id,
+            ],
+            set_={
+                field: getattr(DailyRollup, field) + getattr(stmt.excluded, field)
+                for field in FIELDS
+            },
+        )
+        await db.execute(stmt)
+
+
+def _period(granularity):
+    if granularity == "week":
+        # Monday of the day's week
+        return func.date(DailyRollup.day, "weekday 0", "-6 days")
+    if granularity == "month":
+        return func.strftime("%Y-%m-01", DailyRollup.day)
+    return func.date(DailyRollup.day)
+
+
+async def get_balance_history(db, granularity="day", start=None, end=None, user_id=None):
+    """Running balance between each pair of users, plus resolved counts per category.
+
+    `balance` is what user B owes user A at the end of each period and
+    `net_won_units` what user A has won from user B overall.
+    """
+    user_names = await reference.users.load(db)
+    category_names = await reference.categories.load(db)
+    pair_columns = (DailyRollup.user_a_id, DailyRollup.user_b_id)
+    conditions = []
+    if user_id is not None:
+        conditions.append(or_(DailyRollup.user_a_id == user_id, DailyRollup.user_b_id == user_id))
+    in_range = list(conditions)
+    if start is not None:
+        in_range.append(DailyRollup.day >= start)
+    if end is not None:
+        in_range.append(DailyRollup.day <= end)
+
+    # Everything before the range only matters as the starting point
+    opening = defaultdict(lambda: [0.0, 0.0])
+    if start is not None:
+        result = await db.execute(
+            select(*pair_columns, func.sum(DailyRollup.won_units), func.sum(DailyRollup.paid_units))
+            .where(DailyRollup.day < start, *conditions)
+            .group_by(*pair_columns)
+        )
+        for user_a_id, user_b_id, won_units, paid_units in result.all():
+            opening[(user_a_id, user_b_id)] = [won_units, paid_units]
+
+    period = _period(granularity).label("period")
+    result = await db.execute(
+        select(
+            period,
+            *pair_columns,
+            func.sum(DailyRollup.resolved_count),
+            func.sum(DailyRollup.won_units),
+            func.sum(DailyRollup.paid_units),
+        )
+        .where(*in_range)
+        .group_by(period, *pair_columns)
+        .order_by(period)
+    )
+    pairs = {}
+    for period_start, user_a_id, user_b_id, resolved, won_units, paid_units in result.all():
+        pair = (user_a_id, user_b_id)
+        totals = opening[pair]
+        totals[0] += won_units
+        totals[1] += paid_units
+        if pair not in pairs:
+            pairs[pair] = {
+                "user_a": {"id": user_a_id, "name": user_names.get(user_a_id, "Unknown")},
+                "user_b": {"id": user_b_id, "name": user_names.get(user_b_id, "Unknown")},
+                "points": [],
+            }
+        pairs[pair]["points"].append(
+            {
+                "period": period_start,
+                "resolved": resolved,
+                "won_units": round(won_units, 4),
+                "net_won_units": round(totals[0], 4),
+                "balance": round(totals[0] - totals[1], 4),
+            }
+        )
+
+    result = await db.execute(
+        select(period, DailyRollup.category_id, func.sum(DailyRollup.resolved_count))
+        .where(*in_range)
+        .group_by(period, DailyRollup.category_id)
+        .order_by(period)
+    )
+    categories = {}
+    for period_start, category_id, resolved in result.all():
+        if not resolved:
+            continue
+        category = categories.setdefault(
+            category_id,
+            {
+                "id": category_id,
+                "name": category_names.get(category_id, "Unknown"),
+                "points": [],
+            },
+        )
+        category["points"].append({"period": period_start, "resolved": resolved})
+
+    return {
+        "granularity": granularity,
+        "pairs": [pairs[pair] for pair in sorted(pairs)],
+        "categories": [categories[category_id] for category_id in sorted(categories)],
+    }
+
+
+def _settled(table):
+    return select(
+        table.c.status,
+        table.c.creator_id,
+        table.c.opponent_id,
+        table.c.category_id,
+        table.c.win_units,
+        table.c.loss_units,
+        table.c.outcome,
+        table.c.created_at,
+        table.c.resolved_at,
+        table.c.redeemed_at,
+    ).where(table.c.status.in_(SETTLED_STATUSES))
+
+
+async def compute_rollups(db):
+    # Archived bets keep their place in the history
+    result = await db.stream(archive.history(_settled))
+    totals = None
+    async for partition in result.partitions(1000):
+        entries = [entry for row in partition for entry in rollup_entries(row)]
+        totals = accumulate(entries, totals=totals)
+    return totals if totals is not None else {}
+
+
+async def verify_rollups(db):
+    """Compare the stored rollups with a full recomputation and return any drift."""
+    expected = await compute_rollups(db)
+    result = await db.execute(
+        select(
+            DailyRollup.day,
+            DailyRollup.user_a_id,
+            DailyRollup.user_b_id,
+            DailyRollup.category_id,
+            *(getattr(DailyRollup, field) for field in FIELDS),
+        )
+    )
+    stored = {tuple(row[:4]): list(row[4:]) for row in result.all()}
+    empty = [0] * len(FIELDS)
+    drift = []
+    for key in sorted(set(expected) | set(stored)):
+        stored_sums = stored.get(key, empty)
+        expected_sums = expected.get(key, empty)
+        if any(abs(a - b) > EPSILON for a, b in zip(stored_sums, expected_sums)):
+            drift.append((key, stored_sums, list(expected_sums)))
+    return drift
+
+
+async def rebuild_rollups(db):
+    expected = await compute_rollups(db)
+    await db.execute(delete(DailyRollup))
+    if expected:
+        await db.execute(
+            insert(DailyRollup),
+            [
+                {
+                    "day": day,
+                    "user_a_id": user_a_id,
+                    "user_b_id": user_b_id,
+                    "category_id": category_id,
+                    **dict(zip(FIELDS, sums)),
+                }
+                for (day, user_a_id, user_b_id, category_id), sums in expected.items()
+            ],
+        )
@@ -0,0 +1,268 @@
+import asyncio
+import collections
+import contextlib
+import datetime
+import logging
+import os
+import sqlite3
+import time
+
+from decouple import config
+from sqlalchemy import select, update
+from sqlalchemy.dialects.sqlite import insert
+
+from app.database.database import (
+    DATABASE_PATH,
+    DB_BUSY_TIMEOUT_MS,
+    SessionLocal,
+    WriteSessionLocal,
+)
+from app.models.models import JobRun
+from app.services import archive, calibration, ledger, metrics, rollups
+
+logger = logging.getLogger("app.scheduler")
+
+SCHEDULER_ENABLED = config("SCHEDULER_ENABLED", default=True, cast=bool)
+BACKUP_DIR = config(
+    "BACKUP_DIR", default=os.path.join(os.path.dirname(DATABASE_PATH), "backups")
+)
+BACKUP_INTERVAL_HOURS = config("BACKUP_INTERVAL_HOURS", default=24, cast=float)
+BACKUP_KEEP = config("BACKUP_KEEP", default=7, cast=int)
+
+# How often each server process looks for jobs that have fallen due
+TICK_SECONDS = 60
+# Pages copied per backup step; other connections can write in between
+BACKUP_STEP_PAGES = 1024
+# Rows sampled per index by ANALYZE, enough for the planner's choices
+ANALYSIS_LIMIT = 1000
+
+Job = collections.namedtuple("Job", "name interval run")
+
+
+def _connect():
+    # Maintenance runs on its own connection in a worker thread; autocommit
+    # mode because VACUUM cannot run inside a transaction
+    return sqlite3.connect(
+        DATABASE_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000, isolation_level=None
+    )
+
+
+def optimize():
+    with contextlib.closing(_connect()) as conn:
+        # PRAGMA optimize only analyzes tables its own connection has queried,
+        # which for a fresh connection is none, so refresh the statistics of
+        # every table from a bounded sample instead
+        conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        conn.execute("ANALYZE")
+    return "Refreshed query planner statistics"
+
+
+def vacuum():
+    with contextlib.closing(_connect()) as conn:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            # Databases created before incremental auto-vacuum was enabled
+            # need one full VACUUM to switch
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+            detail = "Rebuilt the database with incremental auto-vacuum"
+        else:
+            free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            # Each step of the statement releases one page
+            conn.execute("PRAGMA incremental_vacuum").fetchall()
+            detail = f"Released {free_pages} free page(s)"
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    return detail
+
+
+def _backup_prefix():
+    return os.path.splitext(os.path.basename(DATABASE_PATH))[0] + "-"
+
+
+def list_backups():
+    """Backup files, newest first."""
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    backups = []
+    for name in os.listdir(BACKUP_DIR):
+        if name.startswith(_backup_prefix()) and name.endswith(".db"):
+            stat = os.stat(os.path.join(BACKUP_DIR, name))
+            backups.append(
+                {
+                    "name": name,
+                    "size_bytes": stat.st_size,
+                    "created_at": datetime.datetime.utcfromtimestamp(stat.st_mtime),
+                }
+            )
+    # Names carry a sortable UTC timestamp
+    return sorted(backups, key=lambda backup: backup["name"], reverse=True)
+
+
+def backup():
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    stamp = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    name = f"{_backup_prefix()}{stamp}.db"
+    path = os.path.join(BACKUP_DIR, name)
+    partial = path + ".partial"
+    # The online backup API copies a consistent snapshot while the app keeps
+    # reading and writing; the file only gets its final name once complete
+    with contextlib.closing(_connect()) as source, contextlib.closing(
+        sqlite3.connect(partial)
+    ) as target:
+        source.backup(target, pages=BACKUP_STEP_PAGES, sleep=0.01)
+    os.replace(partial, path)
+    removed = 0
+    for old in list_backups()[BACKUP_KEEP:]:
+        os.remove(os.path.join(BACKUP_DIR, old["name"]))
+        removed += 1
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+    return f"Saved {name} ({size_mb:.1f} MiB), removed {removed} old backup(s)"
+
+
+DERIVED_TABLES = [
+    ("balances", ledger.verify_ledger, ledger.rebuild_ledger),
+    ("calibration_buckets", calibration.verify_calibration, calibration.rebuild_calibration),
+    ("daily_rollups", rollups.verify_rollups, rollups.rebuild_rollups),
+    ("archived_user_stats", archive.verify_user_stats, archive.rebuild_user_stats),
+]
+
+
+async def verify_derived_tables():
+    # The tables are kept up to date by the mutation endpoints; this catches
+    # drift from edits made outside the app and repairs it
+    drifted = []
+    async with SessionLocal() as session:
+        for name, verify, rebuild in DERIVED_TABLES:
+            drift = await verify(session)
+            if drift:
+                drifted.append((name, len(drift), rebuild))
+    if not drifted:
+        return "Derived tables are consistent"
+    async with WriteSessionLocal() as session:
+        for name, count, rebuild in drifted:
+            logger.warning("%s drifted in %d row(s), rebuilding it", name, count)
+            await rebuild(session)
+        await session.commit()
+    return "Rebuilt " + ", ".join(f"{name} ({count} row(s))" for name, count, _ in drifted)
+
+
+async def archive_redeemed():
+    moved = await archive.archive_redeemed()
+    return f"Archived {moved} prediction(s) redeemed over {archive.ARCHIVE_AFTER_DAYS} days ago"
+
+
+def _in_thread(function):
+    async def run():
+        return await asyncio.to_thread(function)
+
+    return run
+
+
+JOBS = {
+    job.name: job
+    for job in [
+        Job("archive", datetime.timedelta(days=1), archive_redeemed),
+        Job("optimize", datetime.timedelta(hours=6), _in_thread(optimize)),
+        Job("vacuum", datetime.timedelta(days=1), _in_thread(vacuum)),
+        Job("backup", datetime.timedelta(hours=BACKUP_INTERVAL_HOURS), _in_thread(backup)),
+        Job("verify-derived", datetime.timedelta(days=1), verify_derived_tables),
+    ]
+}
+
+
+async def _claim(job, now, force):
+    # Every server process runs a scheduler; the one whose conditional upsert
+    # goes through runs the job
+    running = {
+        "started_at": now,
+        "finished_at": None,
+        "duration_seconds": None,
+        "status": "running",
+        "detail": None,
+    }
+    stmt = (
+        insert(JobRun)
+        .values(name=job.name, **running)
+        .on_conflict_do_update(
+            index_elements=[JobRun.name],
+            set_=running,
+            where=None if force else JobRun.started_at <= now - job.interval,
+        )
+        .returning(JobRun.name)
+    )
+    async with WriteSessionLocal() as session:
+        claimed = (await session.execute(stmt)).first() is not None
+        await session.commit()
+    return claimed
+
+
+async def run_job(job, force=False):
+    """Run a job if it is due (or regardless, with force); returns (status, detail) or None."""
+    if not await _claim(job, datetime.datetime.utcnow(), force):
+        return None
+    started = time.perf_counter()
+    try:
+        detail = await job.run()
+        status = "ok"
+    except Exception as e:
+        logger.exception("Maintenance job %s failed", job.name)
+        detail = f"{type(e).__name__}: {e}"
+        status = "failed"
+    elapsed = time.perf_counter() - started
+    metrics.job_duration.observe(elapsed, job=job.name)
+    metrics.job_runs.inc(job=job.name, status=status)
+    async with WriteSessionLocal() as session:
+        await session.execute(
+            update(JobRun)
+            .where(JobRun.name == job.name)
+            .values(
+                finished_at=datetime.datetime.utcnow(),
+                duration_seconds=elapsed,
+                status=status,
+                detail=detail,
+            )
+        )
+        await session.commit()
+    logger.info("Maintenance job %s finished in %.1f s: %s", job.name, elapsed, detail)
+    return status, detail
+
+
+async def run_due_jobs():
+    async with SessionLocal() as session:
+        result = await session.execute(select(JobRun.name, JobRun.started_at))
+        last_started = dict(result.all())
+    now = datetime.datetime.utcnow()
+    for job in JOBS.values():
+        started_at = last_started.get(job.name)
+        if started_at is None or started_at <= now - job.interval:
+            await run_job(job)
+
+
+async def run_scheduler():
+    """Run maintenance jobs as they fall due, for as long as the server runs."""
+    while True:
+        await asyncio.sleep(TICK_SECONDS)
+        try:
+            await run_due_jobs()
+        except Exception:
+            logger.exception("Could not run maintenance jobs")
+
+
+async def get_status(db):
+    result = await db.execute(select(JobRun))
+    runs = {run.name: run for run in result.scalars()}
+    jobs = []
+    for job in JOBS.values():
+        run = runs.get(job.name)
+        jobs.append(
+            {
+                "name": job.name,
+                "interval_seconds": job.interval.total_seconds(),
+                "status": run.status if run else None,
+                "started_at": run.started_at if run else None,
+                "finished_at": run.finished_at if run else None,
+                "duration_seconds": run.duration_seconds if run else None,
+                "detail": run.detail if run else None,
+                "next_run_at": run.started_at + job.interval if run else None,
+            }
+        )
+    return {"jobs": jobs, "backups": list_backups()}
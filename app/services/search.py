@@ -0,0 +1,71 @@
+import html
+import re
+
+from sqlalchemy import Float, Integer, column, func, literal_column, select, table, text
+
+from app.models.models import Prediction
+
+# External-content FTS5 index over the descriptions of live and archived
+# predictions (through the prediction_history view), kept in sync by the
+# triggers created in migration 0008
+FTS_TABLE = "predictions_fts"
+predictions_fts = table(FTS_TABLE, column("rowid", Integer), column("rank", Float))
+
+SNIPPET_TOKENS = 12
+# Private-use characters mark the matches so the snippet can be HTML escaped
+# before the markers are swapped for <mark> tags
+MATCH_START = "\ue000"
+MATCH_END = "\ue001"
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+
+def match_query(text):
+    """Turn free text into an FTS5 query that prefix-matches every word.
+
+    Words are quoted so FTS5 operators and punctuation in user input are
+    treated as plain text. Returns None when there is nothing to search for.
+    """
+    terms = _TERM.findall(text)
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def match(query):
+    return literal_column(FTS_TABLE).op("MATCH")(query)
+
+
+def matches(query, id_column=Prediction.id):
+    # A condition on a prediction id, usable with any other filters
+    return id_column.in_(select(predictions_fts.c.rowid).where(match(query)))
+
+
+def snippet():
+    return func.snippet(literal_column(FTS_TABLE), 0, MATCH_START, MATCH_END, "…", SNIPPET_TOKENS)
+
+
+def join(table):
+    """Join a predictions table to the index, with the index driving the join.
+
+    The `+ 0` keeps SQLite from probing the index by rowid for each row of a
+    filtered scan of the table, which would run the MATCH once per row.
+    """
+    return predictions_fts.join(table, table.c.id == predictions_fts.c.rowid + 0)
+
+
+def highlight(snippet):
+    if snippet is None:
+        return None
+    return (
+        html.escape(snippet)
+        .replace(MATCH_START, "<mark>")
+        .replace(MATCH_END, "</mark>")
+    )
+
+
+async def rebuild_index(db):
+    """Re-index every prediction, e.g. after bulk changes made without the triggers."""
+    await db.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    result = await db.execute(select(func.count()).select_from(predictions_fts))
+    return result.scalar_one()
@@ -0,0 +1,301 @@
+import asyncio
+from collections import defaultdict
+
+import numpy as np
+from sqlalchemy import func, or_, select
+
+from app.models.models import Balance, CalibrationBucket, Prediction
+from app.services import calibration, odds, reference
+
+# Bets still waiting on their outcome; pending ones are projected as if accepted
+OPEN_STATUSES = ("PENDING", "OPEN")
+
+DEFAULT_TRIALS = 200_000
+MAX_TRIALS = 1_000_000
+# Caps trials x draws per trial, so a long list of open bets costs fewer
+# trials rather than more time
+MAX_DRAWS = 4_000_000
+MIN_TRIALS = 10_000
+# Trials are drawn in batches of about this many draws to bound memory
+BATCH_DRAWS = 1 << 20
+# Groups of identical bets whose win count varies at least this much are
+# drawn together from a normal approximation
+NORMAL_VARIANCE = 9.0
+# A creator's calibration bucket counts as much as their stated confidence
+# once it holds this many decided bets
+PRIOR_WEIGHT = 20
+# Tail risk is measured over the worst 5% of trials
+TAIL = 0.05
+PERCENTILES = (5, 25, 50, 75, 95)
+HISTOGRAM_BINS = 20
+# The same data always gives the same projection, whichever worker runs it,
+# so the response can be cached and revalidated per data version
+SEED = 0
+
+
+class _Proposal:
+    # A bet being priced that has not been written yet
+    __slots__ = ("creator_id", "opponent_id", "confidence", "win_units", "loss_units", "bets")
+
+    def __init__(self, creator_id, opponent_id, confidence):
+        self.creator_id = creator_id
+        self.opponent_id = opponent_id
+        self.confidence = confidence
+        self.win_units, self.loss_units = odds.payouts(confidence)
+        self.bets = 1
+
+
+async def load_calibration(db):
+    """Return {(user_id, bucket): (count, confidence_sum, hits)} over all categories."""
+    result = await db.execute(
+        select(
+            CalibrationBucket.user_id,
+            CalibrationBucket.bucket,
+            func.sum(CalibrationBucket.count),
+            func.sum(CalibrationBucket.confidence_sum),
+            func.sum(CalibrationBucket.hits),
+        )
+        .where(CalibrationBucket.count > 0)
+        .group_by(CalibrationBucket.user_id, CalibrationBucket.bucket)
+    )
+    return {(user_id, bucket): tuple(sums) for user_id, bucket, *sums in result.all()}
+
+
+def calibrated_probability(user_id, confidence, buckets):
+    """Chance that a bet at `confidence` comes true, given its creator's record.
+
+    The stated confidence is shifted by how far the creator's hit rate in
+    that confidence bucket has been from their mean confidence there, trusting
+    the record more as the bucket fills up. Returns (probability, decided bets).
+    """
+    count, confidence_sum, hits = buckets.get(
+        (user_id, calibration.bucket_for(confidence)), (0, 0.0, 0)
+    )
+    if not count:
+        return confidence, 0
+    weight = count / (count + PRIOR_WEIGHT)
+    probability = confidence + weight * (hits - confidence_sum) / count
+    return min(max(probability, 0.0), 1.0), count
+
+
+async def _open_groups(db, user_id):
+    # Identical open bets are simulated together as one binomial draw
+    conditions = [Prediction.status.in_(OPEN_STATUSES)]
+    if user_id is not None:
+        conditions.append(
+            or_(Prediction.creator_id == user_id, Prediction.opponent_id == user_id)
+        )
+    columns = (
+        Prediction.creator_id,
+        Prediction.opponent_id,
+        Prediction.confidence,
+        Prediction.win_units,
+        Prediction.loss_units,
+    )
+    result = await db.execute(
+        select(*columns, func.count().label("bets")).where(*conditions).group_by(*columns)
+    )
+    return result.all()
+
+
+async def _pair_balances(db):
+    # What user_b owes user_a, for user_a < user_b
+    result = await db.execute(select(Balance.debtor_id, Balance.creditor_id, Balance.amount))
+    balances = defaultdict(float)
+    for debtor_id, creditor_id, amount in result.all():
+        if creditor_id < debtor_id:
+            balances[(creditor_id, debtor_id)] += amount
+        else:
+            balances[(debtor_id, creditor_id)] -= amount
+    return balances
+
+
+def simulate(counts, probabilities, win_units, loss_units, weights, trials):
+    """Monte Carlo totals of the creators' units, weighted into outcome columns.
+
+    `weights` is a (groups, columns) matrix saying how much of each group's
+    creator units goes into each column, e.g. +1 for the creator's own net
+    units and -1 for the opponent's. Returns a (trials, columns) array, with
+    fewer trials than asked for when there are many bets to draw.
+    """
+    rng = np.random.default_rng(SEED)
+    # Units won by the creators are wins * (win + loss) - count * loss, so
+    # only the win counts vary from trial to trial
+    per_win = weights * (win_units + loss_units)[:, None]
+    offset = (counts * loss_units) @ weights
+    variance = counts * probabilities * (1 - probabilities)
+    normal = variance >= NORMAL_VARIANCE
+    # Bets in small groups are drawn one by one, exactly
+    bet_probabilities = np.repeat(probabilities[~normal], counts[~normal]).astype(np.float32)
+    bet_weights = np.repeat(per_win[~normal], counts[~normal], axis=0)
+    # Large groups only matter through their sum over each column, which is
+    # close to normal, so it is drawn as one multivariate normal per trial
+    offset -= (counts[normal] * probabilities[normal]) @ per_win[normal]
+    scaled = np.sqrt(variance[normal])[:, None] * per_win[normal]
+    eigenvalues, eigenvectors = np.linalg.eigh(scaled.T @ scaled)
+    factor = (eigenvectors * np.sqrt(np.clip(eigenvalues, 0, None))).T
+
+    draws = len(bet_probabilities) + (len(factor) if normal.any() else 0)
+    trials = min(trials, max(MIN_TRIALS, MAX_DRAWS // draws))
+    totals = np.empty((trials, weights.shape[1]))
+    batch = max(1, BATCH_DRAWS // draws)
+    for start in range(0, trials, batch):
+        size = min(batch, trials - start)
+        block = totals[start : start + size]
+        block[:] = -offset
+        if len(bet_probabilities):
+            wins = rng.random((size, len(bet_probabilities)), dtype=np.float32)
+            block += (wins < bet_probabilities).astype(float) @ bet_weights
+        if normal.any():
+            block += rng.standard_normal((size, len(factor))) @ factor
+    return totals
+
+
+def _percentiles(values):
+    return [
+        {"percentile": pct, "units": round(float(units), 2)}
+        for pct, units in zip(PERCENTILES, np.percentile(values, PERCENTILES))
+    ]
+
+
+def _user_summary(values):
+    tail = max(1, int(len(values) * TAIL))
+    worst = np.partition(values, tail - 1)[:tail]
+    return {
+        "expected_units": round(float(values.mean()), 2),
+        "std_units": round(float(values.std()), 2),
+        "percentiles": _percentiles(values),
+        "loss_probability": round(float((values < 0).mean()), 4),
+        # Losses reached in the worst 5% of trials, and their average
+        "value_at_risk": round(max(0.0, -float(np.percentile(values, TAIL * 100))), 2),
+        "expected_shortfall": round(max(0.0, -float(worst.mean())), 2),
+    }
+
+
+def _pair_summary(values):
+    counts, edges = np.histogram(values, bins=HISTOGRAM_BINS)
+    return {
+        "expected_balance": round(float(values.mean()), 2),
+        "std_units": round(float(values.std()), 2),
+        "percentiles": _percentiles(values),
+        "histogram": {
+            "edges": [round(float(edge), 2) for edge in edges],
+            "counts": counts.tolist(),
+        },
+    }
+
+
+async def get_simulation(
+    db,
+    user_id=None,
+    trials=DEFAULT_TRIALS,
+    creator_id=None,
+    opponent_id=None,
+    confidence=None,
+):
+    """Project the open bets' outcomes by Monte Carlo, from the creators' calibration.
+
+    Returns each user's projected net units with their tail risk and the
+    distribution of each pair's balance once the open bets are settled. A
+    bet at `confidence` by `creator_id` can be priced alongside them.
+    """
+    user_names = await reference.users.load(db)
+    buckets = await load_calibration(db)
+    groups = list(await _open_groups(db, user_id))
+    proposal = None
+    if confidence is not None:
+        proposal = _Proposal(creator_id, opponent_id, confidence)
+        groups.append(proposal)
+
+    probabilities = [
+        calibrated_probability(group.creator_id, group.confidence, buckets)[0]
+        for group in groups
+    ]
+
+    user_ids = sorted(
+        {group.creator_id for group in groups}
+        | {group.opponent_id for group in groups if group.opponent_id is not None}
+    )
+    # Pending bets have no opponent yet, so only accepted ones move a pair
+    pairs = sorted(
+        {
+            tuple(sorted((group.creator_id, group.opponent_id)))
+            for group in groups
+            if group.opponent_id is not None
+        }
+    )
+    columns = {("user", user): i for i, user in enumerate(user_ids)}
+    columns.update({("pair", pair): len(user_ids) + i for i, pair in enumerate(pairs)})
+    weights = np.zeros((len(groups), len(columns)))
+    bet_counts = defaultdict(int)
+    for row, group in enumerate(groups):
+        weights[row, columns[("user", group.creator_id)]] = 1.0
+        bet_counts[("user", group.creator_id)] += group.bets
+        if group.opponent_id is None:
+            continue
+        weights[row, columns[("user", group.opponent_id)]] -= 1.0
+        bet_counts[("user", group.opponent_id)] += group.bets
+        pair = tuple(sorted((group.creator_id, group.opponent_id)))
+        # Pair columns hold what the lower user id has won
+        weights[row, columns[("pair", pair)]] = 1.0 if group.creator_id == pair[0] else -1.0
+        bet_counts[("pair", pair)] += group.bets
+
+    if groups:
+        totals = await asyncio.to_thread(
+            simulate,
+            np.array([group.bets for group in groups]),
+            np.array(probabilities),
+            np.array([group.win_units for group in groups]),
+            np.array([group.loss_units for group in groups]),
+            weights,
+            trials,
+        )
+        trials = len(totals)
+    else:
+        trials = 0
+
+    def user_out(user):
+        return {"id": user, "name": user_names.get(user, "Unknown")}
+
+    balances = await _pair_balances(db)
+    users = []
+    for user in user_ids:
+        key = ("user", user)
+        users.append(
+            {**user_out(user), "bets": bet_counts[key], **_user_summary(totals[:, columns[key]])}
+        )
+    pair_results = []
+    for pair in pairs:
+        key = ("pair", pair)
+        summary = _pair_summary(balances[pair] + totals[:, columns[key]])
+        pair_results.append(
+            {
+                "user_a": user_out(pair[0]),
+                "user_b": user_out(pair[1]),
+                "bets": bet_counts[key],
+                "current_balance": round(balances[pair], 2),
+                **summary,
+            }
+        )
+
+    priced = None
+    if proposal is not None:
+        probability, decided = calibrated_probability(creator_id, confidence, buckets)
+        priced = {
+            "creator": user_out(creator_id),
+            "confidence": confidence,
+            "probability": round(probability, 4),
+            "decided_bets": decided,
+            "win_units": round(proposal.win_units, 4),
+            "loss_units": round(proposal.loss_units, 4),
+            "expected_units": round(
+                probability * proposal.win_units - (1 - probability) * proposal.loss_units, 4
+            ),
+        }
+    return {
+        "trials": trials,
+        "bets": sum(group.bets for group in groups),
+        "users": users,
+        "pairs": pair_results,
+        "proposal": priced,
+    }
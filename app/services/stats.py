@@ -0,0 +1,214 @@
+from sqlalchemy import and_, case, func, select, union_all
+
+from app.models.models import Category, Prediction, User
+from app.services import archive, odds, reference
+
+SETTLED_STATUSES = ["RESOLVED", "REDEEMED"]
+
+
+def calculate_units(prediction):
+    return odds.creator_units(prediction.win_units, prediction.loss_units, prediction.outcome)
+
+
+def units_expression():
+    # SQL equivalent of calculate_units() over the stored payout columns
+    return case((Prediction.outcome, Prediction.win_units), else_=-Prediction.loss_units)
+
+
+def _empty_stats(user_id, name):
+    return {
+        "id": user_id,
+        "name": name,
+        "wins": 0,
+        "losses": 0,
+        "net_units": 0.0,
+        "biggest_upset": None,
+        "worst_beat": None,
+        "by_category": {},
+    }
+
+
+def _legs():
+    # One row per participant per settled bet, signed from that participant's side
+    settled = and_(
+        Prediction.status.in_(SETTLED_STATUSES),
+        Prediction.opponent_id.is_not(None),
+    )
+    units = units_expression()
+    creator_legs = select(
+        Prediction.id.label("prediction_id"),
+        Prediction.creator_id.label("user_id"),
+        Prediction.category_id.label("category_id"),
+        Prediction.description.label("description"),
+        units.label("units"),
+    ).where(settled)
+    opponent_legs = select(
+        Prediction.id,
+        Prediction.opponent_id,
+        Prediction.category_id,
+        Prediction.description,
+        -units,
+    ).where(settled)
+    return union_all(creator_legs, opponent_legs).subquery("legs")
+
+
+async def compute_user_stats(db):
+    user_names = await reference.users.load(db)
+    category_names = await reference.categories.load(db)
+    stats = {user_id: _empty_stats(user_id, name) for user_id, name in user_names.items()}
+
+    legs = _legs()
+    won = legs.c.units > 0
+
+    # Wins, losses and net units per (user, category); user totals are the sum
+    category_result = await db.execute(
+        select(
+            legs.c.user_id,
+            legs.c.category_id,
+            func.sum(case((won, 1), else_=0)),
+            func.sum(case((won, 0), else_=1)),
+            func.sum(legs.c.units),
+        ).group_by(legs.c.user_id, legs.c.category_id)
+    )
+    # Archived bets only ever left the live table folded into these totals
+    archived = await archive.load_user_stats(db)
+    category_rows = [
+        *category_result.all(),
+        *((user_id, category_id, *sums[:3]) for (user_id, category_id), sums in archived.items()),
+    ]
+    for user_id, category_id, wins, losses, net_units in category_rows:
+        if user_id not in stats:
+            continue
+        category_name = category_names.get(category_id, "Unknown")
+        user_stats = stats[user_id]
+        user_stats["wins"] += wins
+        user_stats["losses"] += losses
+        user_stats["net_units"] += net_units
+        by_category = user_stats["by_category"].setdefault(
+            category_name, {"wins": 0, "losses": 0}
+        )
+        by_category["wins"] += wins
+        by_category["losses"] += losses
+
+    # Largest win and largest loss per user, earliest bet first on ties
+    upset_rank = func.row_number().over(
+        partition_by=(legs.c.user_id, won),
+        order_by=(case((won, -legs.c.units), else_=legs.c.units), legs.c.prediction_id),
+    )
+    ranked = select(
+        legs.c.user_id,
+        legs.c.prediction_id,
+        legs.c.description,
+        legs.c.units,
+        won.label("won"),
+        upset_rank.label("rank"),
+    ).subquery("ranked")
+    trophy_result = await db.execute(
+        select(
+            ranked.c.user_id,
+            ranked.c.prediction_id,
+            ranked.c.description,
+            ranked.c.units,
+            ranked.c.won,
+        ).where(ranked.c.rank == 1)
+    )
+    best_wins = {}
+    worst_losses = {}
+    for user_id, prediction_id, description, units, is_win in trophy_result.all():
+        trophies = best_wins if is_win else worst_losses
+        trophies[user_id] = (units, prediction_id, description)
+    for (user_id, _), sums in archived.items():
+        best_wins[user_id] = archive.best_win(best_wins.get(user_id), sums[3])
+        worst_losses[user_id] = archive.worst_loss(worst_losses.get(user_id), sums[4])
+    for key, trophies in (("biggest_upset", best_wins), ("worst_beat", worst_losses)):
+        for user_id, trophy in trophies.items():
+            if user_id in stats and trophy is not None:
+                units, _, description = trophy
+                stats[user_id][key] = {"description": description, "units": units}
+
+    return list(stats.values())
+
+
+async def compute_user_stats_reference(db):
+    """Row-by-row Python implementation that compute_user_stats() must agree with."""
+    users_result = await db.execute(select(User.id, User.name))
+    stats = {user_id: _empty_stats(user_id, name) for user_id, name in users_result.all()}
+    categories_result = await db.execute(select(Category.id, Category.name))
+    category_names = dict(categories_result.all())
+
+    def settled(table):
+        return select(
+            table.c.id,
+            table.c.description,
+            table.c.creator_id,
+            table.c.opponent_id,
+            table.c.category_id,
+            table.c.confidence,
+            table.c.outcome,
+        ).where(table.c.status.in_(SETTLED_STATUSES))
+
+    # Archived bets are read row by row here, not from their folded totals
+    history = archive.history(settled)
+    predictions_result = await db.execute(history.order_by(history.selected_columns.id))
+    predictions = [p for p in predictions_result.all() if p.opponent_id is not None]
+    # Recomputed from the confidences rather than read from the stored payout
+    # columns, so this also checks what was stored at write time
+    units = odds.units_array(
+        [p.confidence for p in predictions], [p.outcome for p in predictions]
+    )
+
+    def record(user_id, units, description, category_name, won):
+        if user_id not in stats:
+            return
+        user_stats = stats[user_id]
+        user_stats["net_units"] += units
+        if won:
+            user_stats["wins"] += 1
+            upset = user_stats["biggest_upset"]
+            if not upset or units > upset["units"]:
+                user_stats["biggest_upset"] = {"description": description, "units": units}
+        else:
+            user_stats["losses"] += 1
+            beat = user_stats["worst_beat"]
+            if not beat or units < beat["units"]:
+                user_stats["worst_beat"] = {"description": description, "units": units}
+        by_category = user_stats["by_category"].setdefault(
+            category_name, {"wins": 0, "losses": 0}
+        )
+        by_category["wins" if won else "losses"] += 1
+
+    for p, units_for_creator in zip(predictions, units.tolist()):
+        category_name = category_names.get(p.category_id, "Unknown")
+        record(p.creator_id, units_for_creator, p.description, category_name, units_for_creator > 0)
+        record(p.opponent_id, -units_for_creator, p.description, category_name, units_for_creator < 0)
+
+    return list(stats.values())
+
+
+def compare_user_stats(actual, expected, tolerance=1e-6):
+    """Return a list of human readable differences between two user-stats results."""
+    differences = []
+    actual_by_id = {s["id"]: s for s in actual}
+    for expected_stats in expected:
+        user_id = expected_stats["id"]
+        actual_stats = actual_by_id.get(user_id)
+        if actual_stats is None:
+            differences.append(f"user {user_id}: missing")
+            continue
+        for key in ("wins", "losses", "by_category"):
+            if actual_stats[key] != expected_stats[key]:
+                differences.append(
+                    f"user {user_id} {key}: {actual_stats[key]!r} != {expected_stats[key]!r}"
+                )
+        if abs(actual_stats["net_units"] - expected_stats["net_units"]) > tolerance:
+            differences.append(
+                f"user {user_id} net_units: {actual_stats['net_units']} != {expected_stats['net_units']}"
+            )
+        for key in ("biggest_upset", "worst_beat"):
+            a, e = actual_stats[key], expected_stats[key]
+            if (a is None) != (e is None) or (
+                a is not None
+                and (a["description"] != e["description"] or abs(a["units"] - e["units"]) > tolerance)
+            ):
+                differences.append(f"user {user_id} {key}: {a!r} != {e!r}")
+    return differences
@@ -0,0 +1,301 @@
+import csv
+import datetime
+import io
+import types
+from typing import Optional
+
+import orjson
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import insert
+
+from app.database.database import SessionLocal
+from app.models.models import Prediction
+from app.services import calibration, ledger, listing, odds, reference, rollups
+
+# Rows fetched per round trip on export and inserted per transaction on import
+EXPORT_BATCH_SIZE = 1000
+IMPORT_CHUNK_SIZE = 1000
+# Enough to spot a systematic problem without echoing a whole broken file back
+MAX_REPORTED_ERRORS = 100
+
+STATUSES = ("PENDING", "OPEN", "RESOLVED", "REDEEMED")
+
+EXPORT_FIELDS = (
+    "id",
+    "description",
+    "creator_id",
+    "creator",
+    "opponent_id",
+    "opponent",
+    "category_id",
+    "category",
+    "confidence",
+    "status",
+    "outcome",
+    "created_at",
+    "resolved_at",
+    "redeemed_at",
+)
+
+
+def _isoformat(timestamp):
+    return timestamp.isoformat() if timestamp else None
+
+
+def _export_record(row, user_names, category_names):
+    return {
+        "id": row.id,
+        "description": row.description,
+        "creator_id": row.creator_id,
+        "creator": user_names.get(row.creator_id),
+        "opponent_id": row.opponent_id,
+        "opponent": user_names.get(row.opponent_id),
+        "category_id": row.category_id,
+        "category": category_names.get(row.category_id),
+        "confidence": row.confidence,
+        "status": row.status,
+        "outcome": row.outcome,
+        "created_at": _isoformat(row.created_at),
+        "resolved_at": _isoformat(row.resolved_at),
+        "redeemed_at": _isoformat(row.redeemed_at),
+    }
+
+
+def _encode_ndjson(records):
+    return b"".join(orjson.dumps(record) + b"\n" for record in records)
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value
+
+
+def _encode_csv(records, header=False):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if header:
+        writer.writerow(EXPORT_FIELDS)
+    for record in records:
+        writer.writerow([_csv_value(record[field]) for field in EXPORT_FIELDS])
+    return buffer.getvalue().encode()
+
+
+async def export_predictions(filters, format):
+    """Yield encoded chunks of every matching prediction, oldest first."""
+    # The request's session is closed before a streaming body is sent, so the
+    # export holds its own read connection for as long as the download runs
+    async with SessionLocal() as db:
+        user_names = await reference.users.load(db)
+        category_names = await reference.categories.load(db)
+        stmt = listing.matching(
+            listing.COMPACT_FIELDS + ("resolved_at", "redeemed_at"), filters
+        )
+        stmt = stmt.order_by(stmt.selected_columns.id).execution_options(
+            yield_per=EXPORT_BATCH_SIZE
+        )
+        result = await db.stream(stmt)
+        if format == "csv":
+            yield _encode_csv([], header=True)
+        async for rows in result.partitions():
+            records = [_export_record(row, user_names, category_names) for row in rows]
+            yield _encode_ndjson(records) if format == "ndjson" else _encode_csv(records)
+
+
+class ImportedPrediction(BaseModel):
+    description: str
+    # Users and categories may be given by id, by name or both
+    creator_id: Optional[int] = None
+    creator: Optional[str] = None
+    opponent_id: Optional[int] = None
+    opponent: Optional[str] = None
+    category_id: Optional[int] = None
+    category: Optional[str] = None
+    confidence: float
+    status: str = "PENDING"
+    outcome: Optional[bool] = None
+    created_at: Optional[datetime.datetime] = None
+    resolved_at: Optional[datetime.datetime] = None
+    redeemed_at: Optional[datetime.datetime] = None
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def _lookup(record_id, name, names_by_id, ids_by_name, kind, required=True):
+    # Ids are only meaningful on the device that exported them, so a name
+    # wins when both are given
+    if name is not None:
+        if name not in ids_by_name:
+            raise InvalidRecord(f"Unknown {kind} {name!r}")
+        return ids_by_name[name]
+    if record_id is not None:
+        if record_id not in names_by_id:
+            raise InvalidRecord(f"Unknown {kind} id {record_id}")
+        return record_id
+    if required:
+        raise InvalidRecord(f"Missing {kind}")
+    return None
+
+
+def _prediction_values(record, user_names, category_names, user_ids, category_ids):
+    try:
+        imported = ImportedPrediction(
+            **{key: value for key, value in record.items() if value not in ("", None)}
+        )
+    except ValidationError as e:
+        raise InvalidRecord(
+            "; ".join(
+                f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+                for error in e.errors()
+            )
+        )
+    creator_id = _lookup(imported.creator_id, imported.creator, user_names, user_ids, "creator")
+    opponent_id = _lookup(
+        imported.opponent_id, imported.opponent, user_names, user_ids, "opponent", required=False
+    )
+    category_id = _lookup(
+        imported.category_id, imported.category, category_names, category_ids, "category"
+    )
+    if not 0 < imported.confidence < 1:
+        raise InvalidRecord("confidence must be between 0 and 1")
+    if imported.status not in STATUSES:
+        raise InvalidRecord(f"Unknown status {imported.status!r}")
+    if imported.status == "PENDING" and opponent_id is not None:
+        raise InvalidRecord("A pending bet cannot have an opponent")
+    if imported.status != "PENDING" and opponent_id is None:
+        raise InvalidRecord(f"A {imported.status.lower()} bet needs an opponent")
+    if opponent_id is not None and opponent_id == creator_id:
+        raise InvalidRecord("The opponent cannot be the creator")
+    decided = imported.status in ("RESOLVED", "REDEEMED")
+    if decided != (imported.outcome is not None):
+        raise InvalidRecord(
+            "outcome is required once a bet is resolved"
+            if decided
+            else "Only resolved bets have an outcome"
+        )
+    return {
+        "description": imported.description,
+        "creator_id": creator_id,
+        "opponent_id": opponent_id,
+        "category_id": category_id,
+        "confidence": imported.confidence,
+        **odds.payout_columns(imported.confidence),
+        "status": imported.status,
+        "outcome": imported.outcome,
+        "created_at": imported.created_at or datetime.datetime.utcnow(),
+        "resolved_at": imported.resolved_at if decided else None,
+        "redeemed_at": imported.redeemed_at if imported.status == "REDEEMED" else None,
+    }
+
+
+async def _lines(chunks):
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8-sig", errors="replace").rstrip("\r")
+    if pending:
+        yield pending.decode("utf-8-sig", errors="replace").rstrip("\r")
+
+
+async def _ndjson_records(chunks):
+    line_number = 0
+    async for line in _lines(chunks):
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            record = orjson.loads(line)
+        except orjson.JSONDecodeError as e:
+            yield line_number, InvalidRecord(f"Invalid JSON: {e}")
+            continue
+        if not isinstance(record, dict):
+            yield line_number, InvalidRecord("Expected a JSON object")
+            continue
+        yield line_number, record
+
+
+async def _csv_records(chunks):
+    header = None
+    record_lines = []
+    line_number = start = 0
+    async for line in _lines(chunks):
+        line_number += 1
+        if not record_lines:
+            start = line_number
+        record_lines.append(line)
+        # A quoted description may span lines; the record is complete once
+        # its quotes are balanced ("" escapes count twice)
+        text = "\n".join(record_lines)
+        if text.count('"') % 2:
+            continue
+        record_lines = []
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = values
+            continue
+        if len(values) != len(header):
+            yield start, InvalidRecord(f"Expected {len(header)} columns, got {len(values)}")
+            continue
+        yield start, dict(zip(header, values))
+    if record_lines:
+        yield start, InvalidRecord("Unterminated quoted field")
+
+
+async def import_predictions(db, chunks, format):
+    """Insert predictions from an uploaded NDJSON or CSV stream in chunked transactions.
+
+    Invalid records are skipped and reported by line number; every valid chunk
+    is committed together with its ledger entries as soon as it is full.
+    """
+    # Loading these on the write session could begin its transaction, holding
+    # the write lock for every worker while the upload streams in, so only
+    # flush() touches the writer
+    async with SessionLocal() as read_db:
+        user_names = await reference.users.load(read_db)
+        category_names = await reference.categories.load(read_db)
+    user_ids = {name: user_id for user_id, name in user_names.items()}
+    category_ids = {name: category_id for category_id, name in category_names.items()}
+    records = _csv_records(chunks) if format == "csv" else _ndjson_records(chunks)
+    imported = 0
+    errors = []
+    error_count = 0
+    chunk = []
+
+    async def flush():
+        await db.execute(insert(Prediction.__table__), chunk)
+        rows = [types.SimpleNamespace(**values) for values in chunk]
+        await ledger.post_entries(db, [ledger.ledger_entry(row) for row in rows])
+        await calibration.post_entries(db, rows)
+        await rollups.post_entries(
+            db, [entry for row in rows for entry in rollups.rollup_entries(row)]
+        )
+        await db.commit()
+
+    async for line_number, record in records:
+        try:
+            if isinstance(record, InvalidRecord):
+                raise record
+            chunk.append(
+                _prediction_values(record, user_names, category_names, user_ids, category_ids)
+            )
+        except InvalidRecord as e:
+            error_count += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({"line": line_number, "error": str(e)})
+            continue
+        if len(chunk) == IMPORT_CHUNK_SIZE:
+            await flush()
+            imported += len(chunk)
+            chunk = []
+    if chunk:
+        await flush()
+        imported += len(chunk)
+    return {"imported": imported, "error_count": error_count, "errors": errors}
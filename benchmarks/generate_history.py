@@ -0,0 +1,179 @@
+"""Populate a database with synthetic prediction history.
+
+    python benchmarks/generate_history.py --predictions 100000
+    python benchmarks/generate_history.py --database /tmp/big.db --predictions 1000000 --users 4
+
+The schema is created (or upgraded) through the app's migrations, rows are
+bulk inserted with sqlite3, and the derived tables are rebuilt afterwards so
+the result looks like a database that grew through the API.
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import sqlite3
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Long-running households mostly accumulate settled history
+STATUS_WEIGHTS = {"PENDING": 0.03, "OPEN": 0.07, "RESOLVED": 0.10, "REDEEMED": 0.80}
+CONFIDENCES = [0.25, 0.3, 0.4, 0.5, 0.55, 0.6, 0.66, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95]
+WORDS = (
+    "will the couple get married before finale season week vote win lose rain "
+    "snow traffic dinner late early election debate score team playoffs movie "
+    "release price stock record break cancel renew"
+).split()
+BATCH_SIZE = 10000
+# Matches how SQLAlchemy stores DateTime columns in SQLite
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def database_url(path):
+    return f"sqlite+aiosqlite:///{os.path.abspath(path)}"
+
+
+async def rebuild_derived_tables():
+    """Recompute every table the mutation endpoints normally maintain."""
+    from app.database.database import WriteSessionLocal
+    from app.services import calibration, ledger, rollups
+
+    async with WriteSessionLocal() as session:
+        await ledger.rebuild_ledger(session)
+        await calibration.rebuild_calibration(session)
+        await rollups.rebuild_rollups(session)
+        await session.commit()
+
+
+def _ensure_named_rows(conn, table, prefix, count):
+    existing = [row[0] for row in conn.execute(f"SELECT id FROM {table} ORDER BY id")]
+    for i in range(len(existing), count):
+        conn.execute(f"INSERT INTO {table} (name) VALUES (?)", (f"{prefix} {i + 1}",))
+    return [row[0] for row in conn.execute(f"SELECT id FROM {table} ORDER BY id")][:count]
+
+
+def _prediction_rows(rng, count, user_ids, category_ids, start, span_seconds):
+    from app.services import odds
+
+    statuses = list(STATUS_WEIGHTS)
+    weights = list(STATUS_WEIGHTS.values())
+    step = span_seconds / max(count, 1)
+    end = start + datetime.timedelta(seconds=span_seconds)
+    for i in range(count):
+        creator_id, opponent_id = rng.sample(user_ids, 2)
+        status = rng.choices(statuses, weights)[0]
+        description = " ".join(rng.choices(WORDS, k=rng.randint(4, 10))).capitalize() + "?"
+        confidence = rng.choice(CONFIDENCES)
+        win_units, loss_units = odds.payouts(confidence)
+        created_at = start + datetime.timedelta(seconds=i * step + rng.random() * step)
+        # Bets are typically decided within a few weeks and paid soon after
+        resolved_at = redeemed_at = None
+        if status in ("RESOLVED", "REDEEMED"):
+            resolved_at = min(
+                created_at + datetime.timedelta(days=rng.expovariate(1 / 14)), end
+            )
+        if status == "REDEEMED":
+            redeemed_at = min(resolved_at + datetime.timedelta(days=rng.expovariate(1 / 3)), end)
+        yield (
+            description,
+            creator_id,
+            None if status == "PENDING" else opponent_id,
+            rng.choice(category_ids),
+            confidence,
+            win_units,
+            loss_units,
+            status,
+            None if status in ("PENDING", "OPEN") else rng.random() < 0.5,
+            created_at.strftime(TIMESTAMP_FORMAT),
+            resolved_at.strftime(TIMESTAMP_FORMAT) if resolved_at else None,
+            redeemed_at.strftime(TIMESTAMP_FORMAT) if redeemed_at else None,
+        )
+
+
+def _insert_batch(conn, batch):
+    with conn:
+        conn.executemany(
+            "INSERT INTO predictions (description, creator_id, opponent_id, category_id, "
+            "confidence, win_units, loss_units, status, outcome, created_at, resolved_at, "
+            "redeemed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            batch,
+        )
+
+
+def _insert_history(path, predictions, users, categories, years, seed):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    try:
+        with conn:
+            user_ids = _ensure_named_rows(conn, "users", "User", max(users, 2))
+            category_ids = _ensure_named_rows(conn, "categories", "Category", max(categories, 1))
+        end = datetime.datetime.utcnow()
+        span = datetime.timedelta(days=365 * years)
+        rows = _prediction_rows(
+            rng, predictions, user_ids, category_ids, end - span, span.total_seconds()
+        )
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == BATCH_SIZE:
+                _insert_batch(conn, batch)
+                batch = []
+        if batch:
+            _insert_batch(conn, batch)
+    finally:
+        conn.close()
+
+
+async def _generate(path, predictions, users, categories, years, seed, archive):
+    # The app reads DATABASE_URL when app.database.database is first imported
+    os.environ["DATABASE_URL"] = database_url(path)
+    from app.database.database import engine, write_engine
+    from app.database.init_db import init_db
+
+    await init_db()
+    _insert_history(path, predictions, users, categories, years, seed)
+    await rebuild_derived_tables()
+    if archive:
+        from app.services import archive as archive_service
+
+        await archive_service.archive_redeemed()
+    await write_engine.dispose()
+    await engine.dispose()
+
+
+def generate(path, predictions, users=2, categories=5, years=3, seed=0, archive=False):
+    asyncio.run(_generate(path, predictions, users, categories, years, seed, archive))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", default=os.path.join("data", "prediction.db"))
+    parser.add_argument("--predictions", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=2)
+    parser.add_argument("--categories", type=int, default=5)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--archive",
+        action="store_true",
+        help="Archive old redeemed predictions afterwards, as the scheduler would",
+    )
+    args = parser.parse_args(argv)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.database)), exist_ok=True)
+    generate(
+        args.database,
+        args.predictions,
+        users=args.users,
+        categories=args.categories,
+        years=args.years,
+        seed=args.seed,
+        archive=args.archive,
+    )
+    print(f"Added {args.predictions} predictions to {args.database}")
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, REPO_ROOT)
+    main()
@@ -0,0 +1,308 @@
+"""Benchmark the API against synthetic histories of different sizes.
+
+    python benchmarks/run.py                                  # 1k and 100k predictions
+    python benchmarks/run.py --sizes 1000 100000 1000000 --iterations 50
+    python benchmarks/run.py --json baseline.json             # save results
+    python benchmarks/run.py --compare baseline.json          # exit 1 on regressions
+
+For every size a database is generated once (and cached in --data-dir), then a
+fresh copy is benchmarked in a child process that drives app.main:app through
+httpx's ASGI transport. For each endpoint we report latency percentiles, SQL
+statements per request, peak Python memory allocated while serving one
+request, and response size.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+READ_ENDPOINTS = [
+    ("predictions", "/api/predictions?limit=100"),
+    ("predictions compact", "/api/predictions?format=compact"),
+    ("history page", "/api/predictions?status=REDEEMED&limit=30&format=compact"),
+    ("search", "/api/predictions/search?q=marr"),
+    ("stats", "/api/stats"),
+    ("user-stats", "/api/user-stats"),
+    ("simulate", "/api/simulate"),
+]
+# Repeated polls are normally answered from the response cache; these rows
+# measure that path, the rows above the work behind a cache miss
+CACHED_READ_ENDPOINTS = [
+    ("user-stats cached", "/api/user-stats"),
+    ("user-stats 304", "/api/user-stats"),
+]
+MUTATIONS = ["create", "accept", "resolve", "redeem", "delete"]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, queries, peak_bytes, response_bytes):
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "queries": max(queries),
+        "peak_kib": round(peak_bytes / 1024, 1),
+        "bytes": response_bytes,
+    }
+
+
+async def run_worker(database, iterations):
+    # Must happen before the app (and its engines) are imported
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.abspath(database)}"
+    # Maintenance jobs would land in the middle of the measurements
+    os.environ["SCHEDULER_ENABLED"] = "False"
+    import httpx
+    from sqlalchemy import event
+
+    from app.database.database import engine, write_engine
+    from app.main import app
+    from app.services import cache
+
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    for counted_engine in (engine, write_engine):
+        event.listen(counted_engine.sync_engine, "before_cursor_execute", count_statement)
+
+    async def timed(call):
+        statements.clear()
+        started = time.perf_counter()
+        response = await call()
+        elapsed = time.perf_counter() - started
+        if response.status_code != 304:
+            response.raise_for_status()
+        return response, elapsed, len(statements)
+
+    async def peak_memory(call):
+        # Traced separately because tracemalloc slows down the timed runs
+        tracemalloc.start()
+        try:
+            response = await call()
+            return response, tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    results = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            users = (await client.get("/api/users")).json()
+            categories = (await client.get("/api/categories")).json()
+
+            def uncached_get(url):
+                cache.responses.clear()
+                return client.get(url)
+
+            async def measure(name, call):
+                await call()  # warm caches and connections
+                latencies, queries = [], []
+                for _ in range(iterations):
+                    response, elapsed, count = await timed(call)
+                    latencies.append(elapsed)
+                    queries.append(count)
+                _, peak = await peak_memory(call)
+                results[name] = summarize(latencies, queries, peak, len(response.content))
+
+            for name, url in READ_ENDPOINTS:
+                await measure(name, lambda: uncached_get(url))
+            for name, url in CACHED_READ_ENDPOINTS:
+                headers = {}
+                if name.endswith("304"):
+                    headers["If-None-Match"] = (await client.get(url)).headers["etag"]
+                await measure(name, lambda: client.get(url, headers=headers))
+
+            def mutation_calls(prediction_id=None):
+                return {
+                    "create": lambda: client.post(
+                        "/api/predictions",
+                        json={
+                            "creator_id": users[0]["id"],
+                            "description": "Benchmark bet",
+                            "confidence": 0.8,
+                            "category_id": categories[0]["id"],
+                        },
+                    ),
+                    "accept": lambda: client.post(
+                        f"/api/predictions/{prediction_id}/accept",
+                        json={"user_id": users[1]["id"]},
+                    ),
+                    "resolve": lambda: client.post(
+                        f"/api/predictions/{prediction_id}/resolve",
+                        json={"outcome": False},
+                    ),
+                    "redeem": lambda: client.post(f"/api/predictions/{prediction_id}/redeem"),
+                    "delete": lambda: client.delete(f"/api/predictions/{prediction_id}"),
+                }
+
+            samples = {name: {"latencies": [], "queries": [], "bytes": 0} for name in MUTATIONS}
+            # One create -> accept -> resolve -> redeem -> delete cycle per
+            # iteration; the first cycle only warms up
+            for i in range(iterations + 1):
+                prediction_id = None
+                for name in MUTATIONS:
+                    response, elapsed, count = await timed(mutation_calls(prediction_id)[name])
+                    if name == "create":
+                        prediction_id = response.json()["id"]
+                    if i > 0:
+                        samples[name]["latencies"].append(elapsed)
+                        samples[name]["queries"].append(count)
+                        samples[name]["bytes"] = len(response.content)
+
+            peaks = {}
+            prediction_id = None
+            for name in MUTATIONS:
+                response, peaks[name] = await peak_memory(mutation_calls(prediction_id)[name])
+                if name == "create":
+                    prediction_id = response.json()["id"]
+
+            for name, sample in samples.items():
+                results[name] = summarize(
+                    sample["latencies"], sample["queries"], peaks[name], sample["bytes"]
+                )
+    return results
+
+
+def worker_main(database, iterations):
+    # The app resolves static/ and templates/ relative to the working directory
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        os.makedirs("static")
+        os.symlink(os.path.join(REPO_ROOT, "templates"), "templates")
+        sys.path.insert(0, REPO_ROOT)
+        results = asyncio.run(run_worker(database, iterations))
+    json.dump(results, sys.stdout)
+
+
+def benchmark_size(size, data_dir, iterations, regenerate, archive):
+    source = os.path.join(data_dir, f"history-{size}{'-archived' if archive else ''}.db")
+    if regenerate or not os.path.exists(source):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(source + suffix):
+                os.remove(source + suffix)
+        print(f"Generating {size} predictions...", file=sys.stderr)
+        # Generate in a child process so every size gets fresh engines
+        subprocess.run(
+            [
+                sys.executable,
+                os.path.join(REPO_ROOT, "benchmarks", "generate_history.py"),
+                "--database",
+                source,
+                "--predictions",
+                str(size),
+                *(["--archive"] if archive else []),
+            ],
+            check=True,
+            cwd=REPO_ROOT,
+            stdout=subprocess.DEVNULL,
+        )
+    with tempfile.TemporaryDirectory() as scratch:
+        # Mutations change the data, so every run starts from a pristine copy
+        working_copy = os.path.join(scratch, "bench.db")
+        shutil.copyfile(source, working_copy)
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", working_copy,
+             "--iterations", str(iterations)],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+    return json.loads(output.stdout)
+
+
+def print_table(size, results):
+    print(f"\n{size} predictions")
+    print(f"{'endpoint':<22}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'peak KiB':>10}{'bytes':>10}")
+    for name, metrics in results.items():
+        print(
+            f"{name:<22}{metrics['p50_ms']:>9}{metrics['p95_ms']:>9}{metrics['p99_ms']:>9}"
+            f"{metrics['queries']:>9}{metrics['peak_kib']:>10}{metrics['bytes']:>10}"
+        )
+
+
+def find_regressions(results, baseline, threshold):
+    regressions = []
+    for size, endpoints in results.items():
+        for name, metrics in endpoints.items():
+            before = baseline.get(size, {}).get(name)
+            if before is None:
+                continue
+            if metrics["queries"] > before["queries"]:
+                regressions.append(
+                    f"{size} {name}: {before['queries']} -> {metrics['queries']} queries"
+                )
+            if metrics["p50_ms"] > before["p50_ms"] * threshold:
+                regressions.append(
+                    f"{size} {name}: p50 {before['p50_ms']} -> {metrics['p50_ms']} ms"
+                )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument(
+        "--data-dir",
+        default=os.path.join(tempfile.gettempdir(), "prediction-manager-bench"),
+        help="Where generated databases are cached between runs",
+    )
+    parser.add_argument("--regenerate", action="store_true")
+    parser.add_argument(
+        "--archive",
+        action="store_true",
+        help="Measure databases whose old redeemed predictions have been archived",
+    )
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--compare", help="Baseline results to check for regressions")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="Allowed p50 slowdown factor before --compare reports a regression",
+    )
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        worker_main(args.worker, args.iterations)
+        return 0
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    results = {}
+    for size in args.sizes:
+        results[str(size)] = benchmark_size(
+            size, args.data_dir, args.iterations, args.regenerate, args.archive
+        )
+        print_table(size, results[str(size)])
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
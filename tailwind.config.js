@@ -0,0 +1,10 @@
+// Used to build static/css/app.css; see "Styles" in the README
+module.exports = {
+  // Class names are also assembled in the templates' scripts, which are
+  // scanned as plain text, so keep them as complete literals
+  content: ["./templates/**/*.html"],
+  theme: {
+    extend: {},
+  },
+  plugins: [],
+};
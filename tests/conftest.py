@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# The engines read DATABASE_URL when app.database is first imported, so the
+# throwaway database has to be configured before any test module loads the app
+DATA_DIR = tempfile.mkdtemp(prefix="prediction-manager-tests-")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(DATA_DIR, 'test.db')}"
+os.environ["SCHEDULER_ENABLED"] = "False"
+
+import httpx  # noqa: E402
+
+from app.database.database import SessionLocal  # noqa: E402
+from app.main import app  # noqa: E402
+from app.services import archive, calibration, ledger, rollups, stats  # noqa: E402
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+async def client():
+    # One app and database for the whole run; tests only ever add data and
+    # check invariants that hold whatever else is in the tables
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            yield client
+
+
+@pytest.fixture(scope="session")
+async def users(client):
+    return (await client.get("/api/users")).json()
+
+
+@pytest.fixture(scope="session")
+async def categories(client):
+    return (await client.get("/api/categories")).json()
+
+
+async def _find_drift():
+    """Return every derived table that disagrees with a recomputation from the predictions."""
+    drift = {}
+    async with SessionLocal() as db:
+        for name, verify in (
+            ("balances", ledger.verify_ledger),
+            ("calibration_buckets", calibration.verify_calibration),
+            ("daily_rollups", rollups.verify_rollups),
+            ("archived_user_stats", archive.verify_user_stats),
+        ):
+            found = await verify(db)
+            if found:
+                drift[name] = found
+        differences = stats.compare_user_stats(
+            await stats.compute_user_stats(db), await stats.compute_user_stats_reference(db)
+        )
+        if differences:
+            drift["user_stats"] = differences
+    return drift
+
+
+@pytest.fixture
+def find_drift():
+    return _find_drift
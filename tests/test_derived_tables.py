@@ -0,0 +1,166 @@
+import json
+
+import pytest
+
+from app.services import archive
+
+pytestmark = pytest.mark.anyio
+
+
+async def create(client, users, categories, confidence, category=0, accept=True):
+    response = await client.post(
+        "/api/predictions",
+        json={
+            "creator_id": users[0]["id"],
+            "description": f"Bet at {confidence}",
+            "confidence": confidence,
+            "category_id": categories[category]["id"],
+        },
+    )
+    assert response.status_code == 200, response.text
+    prediction_id = response.json()["id"]
+    if accept:
+        response = await client.post(
+            f"/api/predictions/{prediction_id}/accept", json={"user_id": users[1]["id"]}
+        )
+        assert response.status_code == 200, response.text
+    return prediction_id
+
+
+async def test_single_mutations(client, users, categories, find_drift):
+    pending = await create(client, users, categories, 0.7, accept=False)
+    ids = [
+        await create(client, users, categories, confidence, category)
+        for confidence, category in [(0.05, 0), (0.35, 1), (0.5, 2), (0.8, 0), (0.95, 1)]
+    ]
+    assert await find_drift() == {}
+
+    for prediction_id, outcome in zip(ids, [True, False, True, False, True]):
+        response = await client.post(
+            f"/api/predictions/{prediction_id}/resolve", json={"outcome": outcome}
+        )
+        assert response.status_code == 200, response.text
+    assert await find_drift() == {}
+
+    for prediction_id in ids[:3]:
+        response = await client.post(f"/api/predictions/{prediction_id}/redeem")
+        assert response.status_code == 200, response.text
+    assert await find_drift() == {}
+
+    # A pending, a resolved and a redeemed bet
+    for prediction_id in (pending, ids[0], ids[4]):
+        response = await client.delete(f"/api/predictions/{prediction_id}")
+        assert response.status_code == 204, response.text
+    assert await find_drift() == {}
+
+
+async def test_batch_routes(client, users, categories, find_drift):
+    ids = [
+        await create(client, users, categories, confidence, category)
+        for confidence, category in [(0.2, 0), (0.6, 0), (0.6, 1), (0.9, 2), (0.45, 2)]
+    ]
+    response = await client.post(
+        "/api/predictions/resolve",
+        json={
+            "resolutions": [
+                {"id": prediction_id, "outcome": i % 2 == 0}
+                for i, prediction_id in enumerate(ids)
+            ]
+        },
+    )
+    assert response.status_code == 200, response.text
+    assert response.json()["skipped"] == []
+    assert await find_drift() == {}
+
+    for body in (
+        {"ids": ids[:1]},
+        {"category_id": categories[2]["id"]},
+        {"user_ids": [users[0]["id"], users[1]["id"]]},
+    ):
+        response = await client.post("/api/predictions/redeem", json=body)
+        assert response.status_code == 200, response.text
+        assert await find_drift() == {}
+
+
+async def test_import(client, users, categories, find_drift):
+    records = [
+        {
+            "description": "Imported open bet",
+            "creator": users[1]["name"],
+            "opponent": users[0]["name"],
+            "category": categories[0]["name"],
+            "confidence": 0.65,
+            "status": "OPEN",
+        },
+        {
+            "description": "Imported resolved bet",
+            "creator": users[0]["name"],
+            "opponent": users[1]["name"],
+            "category": categories[1]["name"],
+            "confidence": 0.25,
+            "status": "RESOLVED",
+            "outcome": True,
+            "created_at": "2025-03-01T12:00:00",
+            "resolved_at": "2025-03-04T12:00:00",
+        },
+        {
+            "description": "Imported redeemed bet",
+            "creator": users[1]["name"],
+            "opponent": users[0]["name"],
+            "category": categories[2]["name"],
+            "confidence": 0.85,
+            "status": "REDEEMED",
+            "outcome": False,
+            "created_at": "2025-03-01T12:00:00",
+            "resolved_at": "2025-03-02T12:00:00",
+            "redeemed_at": "2025-03-09T12:00:00",
+        },
+    ]
+    response = await client.post(
+        "/api/predictions/import",
+        content="".join(json.dumps(record) + "\n" for record in records),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200, response.text
+    assert response.json()["imported"] == len(records)
+    assert await find_drift() == {}
+
+
+async def test_archive(client, users, categories, find_drift):
+    # Redeemed long ago, so the archive job moves them
+    records = [
+        {
+            "description": f"Old bet {i}",
+            "creator": users[i % 2]["name"],
+            "opponent": users[1 - i % 2]["name"],
+            "category": categories[i % 3]["name"],
+            "confidence": 0.1 + 0.1 * i,
+            "status": "REDEEMED",
+            "outcome": i % 3 == 0,
+            "created_at": "2024-01-01T12:00:00",
+            "resolved_at": "2024-01-02T12:00:00",
+            "redeemed_at": "2024-01-03T12:00:00",
+        }
+        for i in range(8)
+    ]
+    response = await client.post(
+        "/api/predictions/import",
+        content="".join(json.dumps(record) + "\n" for record in records),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200, response.text
+    user_stats = (await client.get("/api/user-stats")).json()
+
+    assert await archive.archive_redeemed() >= len(records)
+    assert await find_drift() == {}
+    # Archived bets still count, now through archived_user_stats
+    assert (await client.get("/api/user-stats")).json() == user_stats
+
+    # Deleting a category rebuilds the totals of live and archived bets alike
+    response = await client.post("/api/categories", json={"name": "Short-lived"})
+    category = response.json()
+    prediction_id = await create(client, users, [category], 0.55)
+    await client.post(f"/api/predictions/{prediction_id}/resolve", json={"outcome": True})
+    response = await client.delete(f"/api/categories/{category['id']}")
+    assert response.status_code == 204, response.text
+    assert await find_drift() == {}
@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from app.services import listing
+
+pytestmark = pytest.mark.anyio
+
+QUERY = "status=PENDING&q=Paged"
+# More than one default page, so a silently truncated list shows up
+PAGED_ROWS = listing.DEFAULT_PAGE_SIZE + 5
+
+
+@pytest.fixture(scope="module")
+async def paged_ids(client, users, categories):
+    records = [
+        {
+            "description": f"Paged bet {i}",
+            "creator": users[0]["name"],
+            "category": categories[0]["name"],
+            "confidence": 0.6,
+        }
+        for i in range(PAGED_ROWS)
+    ]
+    response = await client.post(
+        "/api/predictions/import",
+        content="".join(json.dumps(record) + "\n" for record in records),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200, response.text
+    response = await client.get(f"/api/predictions?{QUERY}")
+    assert response.status_code == 200
+    assert "x-next-cursor" not in response.headers
+    return [p["id"] for p in response.json()]
+
+
+async def test_full_format_without_limit_returns_everything(paged_ids):
+    assert len(paged_ids) == len(set(paged_ids)) == PAGED_ROWS
+
+
+async def test_full_format_pages_follow_next_cursor_header(client, paged_ids):
+    seen, cursor = [], None
+    while True:
+        url = f"/api/predictions?{QUERY}&limit=40"
+        response = await client.get(url + (f"&cursor={cursor}" if cursor else ""))
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page) <= 40
+        seen += [p["id"] for p in page]
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            break
+    assert seen == paged_ids
+
+
+async def test_compact_pages_follow_next_cursor(client, paged_ids):
+    # The dashboard and history pages read the compact format this way
+    seen, cursor = [], None
+    while True:
+        url = f"/api/predictions?{QUERY}&format=compact&limit=40"
+        response = await client.get(url + (f"&cursor={cursor}" if cursor else ""))
+        assert response.status_code == 200
+        payload = response.json()
+        id_index = payload["columns"].index("id")
+        seen += [row[id_index] for row in payload["rows"]]
+        cursor = payload["next_cursor"]
+        if not cursor:
+            break
+    assert seen == paged_ids
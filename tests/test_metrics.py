@@ -0,0 +1,32 @@
+import re
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+def rows_loaded(text, route):
+    match = re.search(rf'^db_rows_loaded_total{{route="{re.escape(route)}"}} (\d+)$', text, re.M)
+    return int(match.group(1)) if match else 0
+
+
+async def test_rows_loaded_counts_core_rows(client, users, categories):
+    for i in range(3):
+        response = await client.post(
+            "/api/predictions",
+            json={
+                "creator_id": users[0]["id"],
+                "description": f"Metered bet {i}",
+                "confidence": 0.7,
+                "category_id": categories[0]["id"],
+            },
+        )
+        assert response.status_code == 200, response.text
+    before = rows_loaded((await client.get("/metrics")).text, "/api/predictions")
+
+    # An unusual page size keeps the response cache out of the way
+    response = await client.get("/api/predictions?format=compact&limit=3&status=PENDING")
+    assert len(response.json()["rows"]) == 3
+    after = rows_loaded((await client.get("/metrics")).text, "/api/predictions")
+    # The page is read one row past the limit to find the next cursor
+    assert after - before >= 3
@@ -0,0 +1,124 @@
+import pytest
+from sqlalchemy import event
+
+from app.database.database import engine, write_engine
+from app.services import events
+
+pytestmark = pytest.mark.anyio
+
+# Every write transaction also runs BEGIN IMMEDIATE and bumps write_counter.
+# Beyond those, a mutation gets one statement on predictions, which returns
+# everything the response needs, plus one upsert per derived table it moves
+BUDGETS = {
+    "create": 3,
+    "accept": 3,
+    # balances, calibration_buckets and daily_rollups
+    "resolve": 6,
+    # balances and daily_rollups
+    "redeem": 5,
+    # calibration_buckets and daily_rollups, since a redeemed bet owes nothing
+    "delete": 5,
+}
+
+
+@pytest.fixture
+def statements():
+    issued = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        issued.append(statement)
+
+    for counted_engine in (engine, write_engine):
+        event.listen(counted_engine.sync_engine, "before_cursor_execute", count_statement)
+    yield issued
+    for counted_engine in (engine, write_engine):
+        event.remove(counted_engine.sync_engine, "before_cursor_execute", count_statement)
+
+
+async def test_mutation_statement_counts(client, users, categories, statements):
+    # Names are served from the in-process cache once loaded
+    await client.get("/api/users")
+    await client.get("/api/categories")
+    counts = {}
+
+    async def measure(name, method, url, **kwargs):
+        statements.clear()
+        response = await client.request(method, url, **kwargs)
+        assert response.is_success, response.text
+        counts[name] = len(statements)
+        # No read-back after the write
+        touching = [s for s in statements if "predictions" in s.split("WHERE")[0]]
+        assert len(touching) == 1, (name, touching)
+        return response
+
+    response = await measure(
+        "create",
+        "POST",
+        "/api/predictions",
+        json={
+            "creator_id": users[0]["id"],
+            "description": "Counted bet",
+            "confidence": 0.8,
+            "category_id": categories[0]["id"],
+        },
+    )
+    prediction_id = response.json()["id"]
+    await measure(
+        "accept",
+        "POST",
+        f"/api/predictions/{prediction_id}/accept",
+        json={"user_id": users[1]["id"]},
+    )
+    await measure(
+        "resolve", "POST", f"/api/predictions/{prediction_id}/resolve", json={"outcome": False}
+    )
+    await measure("redeem", "POST", f"/api/predictions/{prediction_id}/redeem")
+    await measure("delete", "DELETE", f"/api/predictions/{prediction_id}")
+    assert counts == BUDGETS
+
+
+async def create_open(client, users, categories):
+    response = await client.post(
+        "/api/predictions",
+        json={
+            "creator_id": users[0]["id"],
+            "description": "Batched bet",
+            "confidence": 0.3,
+            "category_id": categories[1]["id"],
+        },
+    )
+    prediction_id = response.json()["id"]
+    await client.post(f"/api/predictions/{prediction_id}/accept", json={"user_id": users[1]["id"]})
+    return prediction_id
+
+
+async def test_batch_routes_take_the_write_lock_once(client, users, categories, statements):
+    ids = [await create_open(client, users, categories) for _ in range(3)]
+    for url, body in (
+        ("/api/predictions/resolve", {"resolutions": [{"id": i, "outcome": True} for i in ids]}),
+        ("/api/predictions/redeem", {"ids": ids}),
+    ):
+        statements.clear()
+        response = await client.post(url, json=body)
+        assert response.status_code == 200, response.text
+        assert response.json()["balances"] is not None
+        assert statements.count("BEGIN IMMEDIATE") == 1, (url, statements)
+
+
+async def test_published_balances_do_not_retake_the_write_lock(
+    client, users, categories, statements
+):
+    prediction_id = await create_open(client, users, categories)
+    queue = events.bus.subscribe()
+    try:
+        statements.clear()
+        response = await client.post(
+            f"/api/predictions/{prediction_id}/resolve", json={"outcome": False}
+        )
+        assert response.status_code == 200, response.text
+        assert statements.count("BEGIN IMMEDIATE") == 1, statements
+        event_type, data = queue.get_nowait()
+        assert event_type == "prediction"
+        assert "balances" in data
+    finally:
+        events.bus.unsubscribe(queue)
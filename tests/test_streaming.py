@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+import pytest
+
+from app.main import app
+from app.services import events
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_event_stream_reaches_gzip_clients(client):
+    # httpx's ASGI transport waits for the whole body, which an event stream
+    # never finishes, so the app is driven directly
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/api/events",
+        "raw_path": b"/api/events",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"test"), (b"accept-encoding", b"gzip, deflate, br")],
+        "client": ("127.0.0.1", 1234),
+        "server": ("test", 80),
+    }
+    disconnected = asyncio.Event()
+    messages = asyncio.Queue()
+
+    async def receive():
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        await messages.put(message)
+
+    async def next_chunk():
+        message = await asyncio.wait_for(messages.get(), timeout=5)
+        assert message["type"] == "http.response.body"
+        return message["body"]
+
+    task = asyncio.create_task(app(scope, receive, send))
+    try:
+        start = await asyncio.wait_for(messages.get(), timeout=5)
+        headers = dict(start["headers"])
+        assert headers[b"content-type"].startswith(b"text/event-stream")
+        assert b"content-encoding" not in headers
+        assert await next_chunk() == b"retry: 3000\n\n"
+
+        events.bus.publish("resync", {})
+        assert await next_chunk() == b"event: resync\ndata: {}\n\n"
+    finally:
+        disconnected.set()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+async def test_export_is_not_compressed(client, users, categories):
+    # Big enough that GZip would otherwise compress it
+    records = [
+        {
+            "description": f"Exported bet number {i} with a longer description",
+            "creator": users[0]["name"],
+            "category": categories[0]["name"],
+            "confidence": 0.6,
+        }
+        for i in range(10)
+    ]
+    await client.post(
+        "/api/predictions/import",
+        content="".join(json.dumps(record) + "\n" for record in records),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    response = await client.get(
+        "/api/predictions/export", headers={"Accept-Encoding": "gzip"}
+    )
+    assert response.status_code == 200
+    assert len(response.content) > 500
+    assert "content-encoding" not in response.headers